@@ -0,0 +1,59 @@
+import argparse
+import datetime
+import json
+import pathlib
+import platform
+import subprocess
+
+import dotenv
+from benchmark import flows, handlers, imports
+
+FUNCTIONS_ROOT = pathlib.Path(__file__).parent.parent
+
+
+def get_commit() -> str:
+    result = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=False)
+    return result.stdout.strip()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure import time and handler latency of the functions codebase.")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--handlers", nargs="*", default=list(handlers.HANDLERS))
+    parser.add_argument("--modules", nargs="*", default=imports.MODULES)
+    parser.add_argument("--flows", nargs="*", default=list(flows.FLOWS))
+    parser.add_argument("--flow-size", type=int, default=flows.DEFAULT_SIZE)
+    args = parser.parse_args()
+
+    dotenv.load_dotenv(FUNCTIONS_ROOT / ".env")
+    import_results = [imports.measure_import(module) for module in args.modules]
+    handler_results = [handlers.measure_handler(name, args.iterations) for name in args.handlers]
+    flow_results = [flows.measure_flow(name, args.flow_size) for name in args.flows]
+    results = {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "imports": import_results,
+        "handlers": handler_results,
+        "flows": flow_results,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    for result in import_results:
+        print(f"import {result['module']}: {result['cumulative_us'] / 1000:.1f} ms")
+    for result in handler_results:
+        print(
+            f"{result['handler']}: first call {result['first_call_ms']:.1f} ms, "
+            f"steady state {result['steady_state_median_ms']:.2f} ms"
+        )
+    for result in flow_results:
+        print(
+            f"{result['flow']}: {result['throughput_per_s']:.0f} items/s, "
+            f"{result['operations_per_item']['firestore_reads']:.2f} reads/item, "
+            f"{result['operations_per_item']['firestore_writes']:.2f} writes/item"
+        )
+
+
+if __name__ == "__main__":
+    main()
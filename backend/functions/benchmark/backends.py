@@ -0,0 +1,167 @@
+import contextlib
+import importlib
+import time
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+from unittest import mock
+
+from benchmark import fake_firestore
+from taqo import clients, config
+
+SPOT_ID = "spot1"
+TRANSACTION_ID = "transaction1"
+SELLER_ID = "seller1"
+BUYER_ID = "buyer1"
+
+
+def sample_documents() -> dict[str, dict[str, dict]]:
+    return {
+        "spots": {
+            SPOT_ID: {
+                "queueName": "Museum",
+                "sellerId": SELLER_ID,
+                "sellerPrice": 10,
+                "buyerPrice": 12.5,
+                "progress": 80,
+                "status": "available",
+                "interestedBuyerIds": [BUYER_ID],
+            },
+        },
+        "transactions": {
+            TRANSACTION_ID: {
+                "status": "pending",
+                "spotId": SPOT_ID,
+                "queueName": "Museum",
+                "sellerId": SELLER_ID,
+                "buyerId": BUYER_ID,
+                "sellerPrice": 10,
+                "buyerPrice": 12.5,
+                "paymentProvider": "stripe",
+                "paymentIntentId": "pi_1",
+                "captureId": "capture1",
+            },
+        },
+        "users": {
+            SELLER_ID: {"paypalEmail": "seller@example.com", "messagingToken": "token1"},
+            BUYER_ID: {"stripeCustomerId": "cus_1", "messagingToken": "token2"},
+        },
+    }
+
+
+def http_response(url: str, **_kwargs: Any) -> mock.Mock:
+    response = mock.Mock(status_code=200 if url in (config.MAILGUN_URL, config.PAYPAL_VERIFY_WEBHOOK_URL) else 201)
+    response.json.return_value = {
+        "id": "order1",
+        "status": "COMPLETED",
+        "access_token": "token",
+        "expires_in": 32400,
+        "verification_status": "SUCCESS",
+        "batch_header": {"payout_batch_id": "batch1"},
+        "purchase_units": [{"payments": {"captures": [{"id": "capture1", "status": "COMPLETED"}]}}],
+    }
+    return response
+
+
+def verified_claims(_id_token: str) -> dict:
+    return {"uid": BUYER_ID, "exp": time.time() + 3600}
+
+
+def multicast_response(message: Any) -> mock.Mock:
+    return mock.Mock(responses=[mock.Mock(success=True) for _ in message.tokens])
+
+
+@dataclass
+class Backends:
+    db: fake_firestore.FakeFirestore = field(default_factory=fake_firestore.FakeFirestore)
+    stripe: mock.Mock = field(default_factory=mock.Mock)
+    publisher: mock.Mock = field(default_factory=mock.Mock)
+    http_post: mock.Mock = field(default_factory=lambda: mock.Mock(side_effect=http_response))
+    async_http_post: mock.AsyncMock = field(default_factory=lambda: mock.AsyncMock(side_effect=http_response))
+    send_multicast: mock.Mock = field(default_factory=lambda: mock.Mock(side_effect=multicast_response))
+    task_queue: mock.Mock = field(default_factory=mock.Mock)
+
+    def __post_init__(self) -> None:
+        ephemeral_key = mock.Mock(secret="ephkey_1")
+        payment_intent = mock.Mock(id="pi_1", client_secret="pi_1_secret")
+        customer = {"id": "cus_1"}
+        self.stripe.EphemeralKey.create.return_value = ephemeral_key
+        self.stripe.EphemeralKey.create_async = mock.AsyncMock(return_value=ephemeral_key)
+        self.stripe.PaymentIntent.create.return_value = payment_intent
+        self.stripe.PaymentIntent.create_async = mock.AsyncMock(return_value=payment_intent)
+        self.stripe.Customer.create.return_value = customer
+        self.stripe.Customer.create_async = mock.AsyncMock(return_value=customer)
+
+    def reset(self, documents: dict[str, dict[str, dict]]) -> None:
+        self.db.reset(documents)
+        self.db.reads = self.db.writes = 0
+        stubs = (
+            self.stripe,
+            self.publisher,
+            self.http_post,
+            self.async_http_post,
+            self.send_multicast,
+            self.task_queue,
+        )
+        for stub in stubs:
+            stub.reset_mock()
+
+    def operations(self) -> dict[str, int]:
+        return {
+            "firestore_reads": self.db.reads,
+            "firestore_writes": self.db.writes,
+            "stripe_calls": len(self.stripe.method_calls),
+            "http_requests": self.http_post.call_count + self.async_http_post.call_count,
+            "pubsub_messages": self.publisher.publish.call_count,
+            "fcm_multicasts": self.send_multicast.call_count,
+            "tasks_enqueued": self.task_queue.enqueue.call_count,
+        }
+
+    def init_stripe(self) -> mock.Mock:
+        clients.init_stripe()
+        return self.stripe
+
+    def init_publisher(self) -> mock.Mock:
+        importlib.import_module("google.cloud.pubsub_v1")
+        return self.publisher
+
+    def init_http_session(self) -> Any:
+        session = clients.init_http_session()
+        session.post = self.http_post
+        return session
+
+    def init_async_http_client(self) -> mock.Mock:
+        importlib.import_module("httpx")
+        return mock.Mock(post=self.async_http_post)
+
+    def init_task_queue(self) -> mock.Mock:
+        return self.task_queue
+
+    def init_firestore_async(self) -> fake_firestore.FakeAsyncFirestore:
+        return fake_firestore.FakeAsyncFirestore(self.db)
+
+
+@contextlib.contextmanager
+def mocked_backends() -> Iterator[Backends]:
+    backends = Backends()
+    stubs = {
+        "stripe": backends.init_stripe,
+        "publisher": backends.init_publisher,
+        "http_session": backends.init_http_session,
+        "async_http_client": backends.init_async_http_client,
+        "firestore_async": backends.init_firestore_async,
+        "task_queue": backends.init_task_queue,
+    }
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(mock.patch("firebase_admin.firestore.client", return_value=backends.db))
+        stack.enter_context(mock.patch("firebase_admin.firestore.transactional", fake_firestore.transactional))
+        stack.enter_context(
+            mock.patch("firebase_admin.firestore_async.async_transactional", fake_firestore.async_transactional)
+        )
+        stack.enter_context(mock.patch("firebase_admin.auth.verify_id_token", side_effect=verified_claims))
+        stack.enter_context(mock.patch("firebase_admin.auth.get_user", return_value=mock.Mock(email="a@example.com")))
+        stack.enter_context(mock.patch("firebase_admin.auth.update_user"))
+        stack.enter_context(mock.patch("firebase_admin.messaging.send_each_for_multicast", backends.send_multicast))
+        stack.enter_context(mock.patch("google.auth.default", return_value=(None, "benchmark")))
+        stack.enter_context(mock.patch.dict(clients.initializers, stubs))
+        stack.enter_context(mock.patch.dict(clients.instances, clear=True))
+        yield backends
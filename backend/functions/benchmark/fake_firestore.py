@@ -0,0 +1,431 @@
+import copy
+import dataclasses
+import functools
+import itertools
+import operator
+import time
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Callable, Iterator, Optional, Union
+
+from firebase_admin import firestore
+from google.api_core import exceptions
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.base_aggregation import AggregationResult
+from google.cloud.firestore_v1.bulk_writer import (
+    BulkWriteFailure,
+    BulkWriterUpdateOperation,
+)
+from google.cloud.firestore_v1.field_path import FieldPath
+from google.rpc import code_pb2  # type: ignore
+
+MAX_BATCH_WRITES = 500
+COUNT_ENTRIES_PER_READ = 1000
+OPERATORS: dict[str, Callable[[Any, Any], bool]] = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda value, values: value in values,
+    "not-in": lambda value, values: value not in values,
+    "array-contains": lambda value, item: isinstance(value, list) and item in value,
+    "array-contains-any": lambda value, items: isinstance(value, list) and any(item in value for item in items),
+}
+MISSING = object()
+
+
+@dataclass
+class StoredDocument:
+    data: dict
+    update_time: int
+
+
+@dataclass(frozen=True)
+class Precondition:
+    last_update_time: Any
+
+
+class FakeDocumentReference:
+    def __init__(self, db: "FakeFirestore", collection: str, document_id: str) -> None:
+        self.db = db
+        self.collection_name = collection
+        self.id = document_id
+
+    @property
+    def path(self) -> str:
+        return f"{self.collection_name}/{self.id}"
+
+    def get(self, field_paths: Optional[list[str]] = None, transaction: Any = None) -> firestore.DocumentSnapshot:
+        _ = transaction
+        self.db.reads += 1
+        return self.db.snapshot(self, self.db.lookup(self), field_paths)
+
+    def create(self, data: dict) -> SimpleNamespace:
+        if self.db.lookup(self) is not None:
+            raise exceptions.AlreadyExists(f"Document already exists: {self.path}")
+        return self.db.apply_set(self, data)
+
+    def set(self, data: dict) -> SimpleNamespace:
+        return self.db.apply_set(self, data)
+
+    def update(self, data: dict, option: Optional[Precondition] = None) -> SimpleNamespace:
+        return self.db.apply_update(self, data, option)
+
+    def delete(self, option: Optional[Precondition] = None) -> SimpleNamespace:
+        return self.db.apply_delete(self, option)
+
+
+@dataclass
+class FakeQuery:
+    db: "FakeFirestore"
+    collection_name: str
+    filters: tuple = ()
+    orders: tuple = ()
+    limit_: Optional[int] = None
+    cursor: Optional[tuple] = None
+
+    def where(self, field_path: str, op_string: str, value: Any) -> "FakeQuery":
+        return dataclasses.replace(self, filters=self.filters + ((field_path, OPERATORS[op_string], value),))
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return dataclasses.replace(self, orders=self.orders + ((field_path, direction == "DESCENDING"),))
+
+    def limit(self, count: int) -> "FakeQuery":
+        return dataclasses.replace(self, limit_=count)
+
+    def start_after(self, document_fields: Union[list, firestore.DocumentSnapshot]) -> "FakeQuery":
+        if isinstance(document_fields, firestore.DocumentSnapshot):
+            document_fields = [
+                self.get_value(document_fields.id, document_fields.to_dict(), path) for path, _ in self.orders
+            ]
+        return dataclasses.replace(self, cursor=tuple(document_fields))
+
+    def count(self, alias: str = "count") -> SimpleNamespace:
+        def get() -> list[list[AggregationResult]]:
+            n_matches = len(self.matches())
+            self.db.reads += max(1, -(-n_matches // COUNT_ENTRIES_PER_READ))
+            return [[AggregationResult(alias=alias, value=n_matches)]]
+
+        return SimpleNamespace(get=get)
+
+    def stream(self) -> Iterator[firestore.DocumentSnapshot]:
+        matches = self.matches()
+        self.db.reads += max(1, len(matches))
+        for document_id, document in matches:
+            yield self.db.snapshot(FakeDocumentReference(self.db, self.collection_name, document_id), document)
+
+    def get(self) -> list[firestore.DocumentSnapshot]:
+        return list(self.stream())
+
+    def matches(self) -> list[tuple[str, StoredDocument]]:
+        matches = [
+            (document_id, document)
+            for document_id, document in self.db.documents.get(self.collection_name, {}).items()
+            if all(self.matches_filter(document_id, document.data, filter_) for filter_ in self.filters)
+            and all(self.get_value(document_id, document.data, path) is not MISSING for path, _ in self.orders)
+        ]
+        matches.sort(key=lambda match: match[0])
+        for path, descending in reversed(self.orders):
+            matches.sort(key=functools.partial(self.get_match_value, path=path), reverse=descending)
+        if self.cursor is not None:
+            matches = [match for match in matches if self.is_after_cursor(match)]
+        return matches[: self.limit_] if self.limit_ is not None else matches
+
+    def matches_filter(self, document_id: str, data: dict, filter_: tuple) -> bool:
+        path, compare, value = filter_
+        field_value = self.get_value(document_id, data, path)
+        if field_value is MISSING:
+            return False
+        try:
+            return compare(field_value, value)
+        except TypeError:
+            return False
+
+    def is_after_cursor(self, match: tuple[str, StoredDocument]) -> bool:
+        assert self.cursor is not None
+        for (path, descending), cursor_value in zip(self.orders, self.cursor):
+            value = self.get_match_value(match, path)
+            if value != cursor_value:
+                return (value < cursor_value) if descending else (value > cursor_value)
+        return False
+
+    def get_match_value(self, match: tuple[str, StoredDocument], path: Any) -> Any:
+        return self.get_value(match[0], match[1].data, path)
+
+    @staticmethod
+    def get_value(document_id: str, data: dict, path: Any) -> Any:
+        if path == FieldPath.document_id():
+            return document_id
+        value: Any = data
+        for part in str(path).split("."):
+            if not isinstance(value, dict) or part not in value:
+                return MISSING
+            value = value[part]
+        return value
+
+
+class FakeCollectionReference(FakeQuery):
+    @property
+    def id(self) -> str:
+        return self.collection_name
+
+    def document(self, document_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self.db, self.collection_name, document_id or self.db.new_id(self.collection_name))
+
+    def add(self, data: dict) -> tuple[Any, FakeDocumentReference]:
+        document_ref = self.document()
+        result = document_ref.set(data)
+        return result.update_time, document_ref
+
+
+class FakeWriteBatch:
+    def __init__(self, db: "FakeFirestore") -> None:
+        self.db = db
+        self.writes: list[Callable[[], SimpleNamespace]] = []
+
+    def set(self, reference: FakeDocumentReference, data: dict) -> None:
+        self.writes.append(lambda: self.db.apply_set(reference, data))
+
+    def update(self, reference: FakeDocumentReference, data: dict, option: Optional[Precondition] = None) -> None:
+        self.writes.append(lambda: self.db.apply_update(reference, data, option))
+
+    def delete(self, reference: FakeDocumentReference, option: Optional[Precondition] = None) -> None:
+        self.writes.append(lambda: self.db.apply_delete(reference, option))
+
+    def commit(self) -> list[SimpleNamespace]:
+        if len(self.writes) > MAX_BATCH_WRITES:
+            raise exceptions.InvalidArgument(f"maximum {MAX_BATCH_WRITES} writes allowed per request")
+        writes, self.writes = self.writes, []
+        return [write() for write in writes]
+
+
+class FakeTransaction(FakeWriteBatch):
+    pass
+
+
+@dataclass
+class FakeBulkWriter:
+    db: "FakeFirestore"
+    result_callback: Optional[Callable] = None
+    error_callback: Optional[Callable] = None
+    pending: list[BulkWriterUpdateOperation] = field(default_factory=list)
+
+    def on_write_result(self, callback: Callable) -> None:
+        self.result_callback = callback
+
+    def on_write_error(self, callback: Callable) -> None:
+        self.error_callback = callback
+
+    def update(self, reference: FakeDocumentReference, field_updates: dict, option: Any = None) -> None:
+        self.pending.append(BulkWriterUpdateOperation(reference, field_updates, option))  # type: ignore
+
+    def flush(self) -> None:
+        pending, self.pending = self.pending, []
+        for operation in pending:
+            self.write(operation)
+
+    def close(self) -> None:
+        self.flush()
+
+    def write(self, operation: BulkWriterUpdateOperation) -> None:
+        while True:
+            try:
+                result = self.db.apply_update(operation.reference, operation.field_updates, operation.option)  # type: ignore
+            except exceptions.GoogleAPICallError as e:
+                operation.attempts += 1
+                failure = BulkWriteFailure(operation, code=get_error_code(e), message=e.message)
+                if self.error_callback is not None and self.error_callback(failure, self):
+                    continue
+                return
+            if self.result_callback is not None:
+                self.result_callback(operation.reference, result, self)
+            return
+
+
+class FakeFirestore:
+    def __init__(self) -> None:
+        self.documents: dict[str, dict[str, StoredDocument]] = {}
+        self.ids = itertools.count()
+        self.versions = itertools.count(1)
+        self.reads = 0
+        self.writes = 0
+
+    def reset(self, documents: dict[str, dict[str, dict]]) -> None:
+        self.documents = {
+            collection: {
+                document_id: StoredDocument(copy.deepcopy(data), next(self.versions))
+                for document_id, data in collection_documents.items()
+            }
+            for collection, collection_documents in documents.items()
+        }
+
+    def data(self, collection: str, document_id: str) -> Optional[dict]:
+        document = self.documents.get(collection, {}).get(document_id)
+        return copy.deepcopy(document.data) if document else None
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, name)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def transaction(self) -> FakeTransaction:
+        return FakeTransaction(self)
+
+    def bulk_writer(self) -> FakeBulkWriter:
+        return FakeBulkWriter(self)
+
+    @staticmethod
+    def write_option(last_update_time: Any) -> Precondition:
+        return Precondition(last_update_time)
+
+    def get_all(
+        self, references: list[FakeDocumentReference], field_paths: Optional[list[str]] = None, transaction: Any = None
+    ) -> Iterator[firestore.DocumentSnapshot]:
+        return (reference.get(field_paths=field_paths, transaction=transaction) for reference in references)
+
+    def new_id(self, collection: str) -> str:
+        return f"{collection}{next(self.ids)}"
+
+    def lookup(self, reference: FakeDocumentReference) -> Optional[StoredDocument]:
+        return self.documents.get(reference.collection_name, {}).get(reference.id)
+
+    def snapshot(
+        self,
+        reference: FakeDocumentReference,
+        document: Optional[StoredDocument],
+        field_paths: Optional[list[str]] = None,
+    ) -> firestore.DocumentSnapshot:
+        data = copy.deepcopy(document.data) if document else None
+        if data is not None and field_paths is not None:
+            data = {path: data[path] for path in field_paths if path in data}
+        update_time = document.update_time if document else None
+        return firestore.DocumentSnapshot(
+            reference, data, exists=document is not None, read_time=None, create_time=None, update_time=update_time
+        )
+
+    def check_precondition(self, reference: FakeDocumentReference, option: Optional[Precondition]) -> StoredDocument:
+        document = self.lookup(reference)
+        if document is None:
+            raise exceptions.NotFound(f"No document to update: {reference.path}")
+        if option is not None and option.last_update_time != document.update_time:
+            raise exceptions.FailedPrecondition(f"Document {reference.path} was modified")
+        return document
+
+    def apply_set(self, reference: FakeDocumentReference, data: dict) -> SimpleNamespace:
+        document = StoredDocument({}, next(self.versions))
+        apply_fields(document.data, data)
+        self.documents.setdefault(reference.collection_name, {})[reference.id] = document
+        return self.write_result(document.update_time)
+
+    def apply_update(
+        self, reference: FakeDocumentReference, data: dict, option: Optional[Precondition] = None
+    ) -> SimpleNamespace:
+        document = self.check_precondition(reference, option)
+        apply_fields(document.data, data)
+        document.update_time = next(self.versions)
+        return self.write_result(document.update_time)
+
+    def apply_delete(self, reference: FakeDocumentReference, option: Optional[Precondition] = None) -> SimpleNamespace:
+        if option is not None:
+            self.check_precondition(reference, option)
+        self.documents.get(reference.collection_name, {}).pop(reference.id, None)
+        return self.write_result(next(self.versions))
+
+    def write_result(self, update_time: int) -> SimpleNamespace:
+        self.writes += 1
+        return SimpleNamespace(update_time=update_time)
+
+
+def apply_fields(data: dict, updates: dict) -> None:
+    for path, value in updates.items():
+        *parents, name = path.split(".")
+        target = data
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        if value is firestore.DELETE_FIELD:
+            target.pop(name, None)
+        elif value is firestore.SERVER_TIMESTAMP:
+            target[name] = int(time.time())
+        elif isinstance(value, transforms.ArrayUnion):
+            existing = target.get(name, [])
+            target[name] = existing + [item for item in value.values if item not in existing]
+        elif isinstance(value, transforms.ArrayRemove):
+            target[name] = [item for item in target.get(name, []) if item not in value.values]
+        elif isinstance(value, transforms.Increment):
+            target[name] = target.get(name, 0) + value.value
+        else:
+            target[name] = copy.deepcopy(value)
+
+
+class FakeAsyncDocumentReference:
+    def __init__(self, db: "FakeFirestore", collection: str, document_id: str) -> None:
+        self.db = db
+        self.collection_name = collection
+        self.id = document_id
+        self.reference = FakeDocumentReference(db, collection, document_id)
+
+    async def get(self, field_paths: Optional[list[str]] = None, transaction: Any = None) -> firestore.DocumentSnapshot:
+        return self.reference.get(field_paths, transaction)
+
+    async def set(self, data: dict) -> SimpleNamespace:
+        return self.reference.set(data)
+
+    async def update(self, data: dict, option: Optional[Precondition] = None) -> SimpleNamespace:
+        return self.reference.update(data, option)
+
+    async def delete(self, option: Optional[Precondition] = None) -> SimpleNamespace:
+        return self.reference.delete(option)
+
+
+class FakeAsyncCollectionReference:
+    def __init__(self, db: "FakeFirestore", name: str) -> None:
+        self.db = db
+        self.name = name
+
+    def document(self, document_id: Optional[str] = None) -> FakeAsyncDocumentReference:
+        return FakeAsyncDocumentReference(self.db, self.name, document_id or self.db.new_id(self.name))
+
+    async def add(self, data: dict) -> tuple[Any, FakeAsyncDocumentReference]:
+        document_ref = self.document()
+        result = await document_ref.set(data)
+        return result.update_time, document_ref
+
+
+class FakeAsyncFirestore:
+    def __init__(self, db: FakeFirestore) -> None:
+        self.db = db
+
+    def collection(self, name: str) -> FakeAsyncCollectionReference:
+        return FakeAsyncCollectionReference(self.db, name)
+
+    def transaction(self) -> FakeTransaction:
+        return FakeTransaction(self.db)
+
+
+def transactional(func: Callable) -> Callable:
+    def run_in_transaction(transaction: FakeTransaction, *args: Any, **kwargs: Any) -> Any:
+        result = func(transaction, *args, **kwargs)
+        transaction.commit()
+        return result
+
+    return run_in_transaction
+
+
+def async_transactional(func: Callable) -> Callable:
+    async def run_in_transaction(transaction: FakeTransaction, *args: Any, **kwargs: Any) -> Any:
+        result = await func(transaction, *args, **kwargs)
+        transaction.commit()
+        return result
+
+    return run_in_transaction
+
+
+def get_error_code(error: exceptions.GoogleAPICallError) -> int:
+    if isinstance(error, exceptions.FailedPrecondition):
+        return code_pb2.FAILED_PRECONDITION
+    if isinstance(error, exceptions.NotFound):
+        return code_pb2.NOT_FOUND
+    return code_pb2.UNKNOWN
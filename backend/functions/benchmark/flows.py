@@ -0,0 +1,207 @@
+import contextlib
+import os
+import statistics
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+from unittest import mock
+
+from benchmark import backends
+from taqo import aio, cache, config, core, paypal, providers, utils, workers
+
+DEFAULT_SIZE = 100
+PRICE_STEPS = (9, 8, 7, 6, 5)
+
+
+@dataclass(frozen=True)
+class Flow:
+    documents: Callable[[int], dict[str, dict[str, dict]]]
+    run: Callable[[int], None]
+    collection: str
+    is_done: Callable[[dict], bool]
+    check: Optional[Callable[[backends.Backends], None]] = None
+
+
+def spot_id(i: int) -> str:
+    return f"spot{i}"
+
+
+def transaction_id(i: int) -> str:
+    return f"transaction{i}"
+
+
+def users() -> dict[str, dict]:
+    return backends.sample_documents()["users"]
+
+
+def spots(n: int, **fields: object) -> dict[str, dict]:
+    spot = backends.sample_documents()["spots"][backends.SPOT_ID]
+    return {spot_id(i): {**spot, **fields} for i in range(n)}
+
+
+def transactions(n: int, get_fields: Callable[[int], dict]) -> dict[str, dict]:
+    transaction = backends.sample_documents()["transactions"][backends.TRANSACTION_ID]
+    return {transaction_id(i): {**transaction, "spotId": spot_id(i), **get_fields(i)} for i in range(n)}
+
+
+def available_spots(n: int) -> dict[str, dict[str, dict]]:
+    return {"spots": spots(n), "users": users()}
+
+
+def reserved_spots(n: int) -> dict[str, dict[str, dict]]:
+    return {"spots": spots(n, status="reserved", reservedAt=utils.timestamp(minutes_ago=10)), "users": users()}
+
+
+def sold_spots(n: int) -> dict[str, dict[str, dict]]:
+    return {
+        "spots": spots(n, status="sold"),
+        "transactions": transactions(
+            n,
+            lambda i: {
+                "status": "charged_buyer",
+                "payout_status": "payout_pending",
+                "bookedAt": utils.timestamp(hours_ago=13),
+            },
+        ),
+        "users": users(),
+    }
+
+
+def spots_to_refund(n: int) -> dict[str, dict[str, dict]]:
+    return {
+        "spots": spots(n, status="sold"),
+        "transactions": transactions(
+            n,
+            lambda i: {
+                "status": "to_refund",
+                "bookedAt": utils.timestamp(minutes_ago=3),
+                "paymentProvider": "stripe" if i % 2 else "paypal",
+            },
+        ),
+        "users": users(),
+    }
+
+
+def reserve(n: int) -> None:
+    for i in range(n):
+        with cache.request_scope():
+            core.reserve_spot(spot_id(i))
+
+
+def stripe_checkout(n: int) -> None:
+    for i in range(n):
+        with cache.request_scope():
+            core.reserve_spot(spot_id(i))
+        with cache.request_scope():
+            transaction_id_ = aio.run(aio.payment_sheet(spot_id(i), backends.BUYER_ID))["transactionId"]
+        with cache.request_scope():
+            aio.run(aio.stripe_book_spot(spot_id(i), transaction_id_))
+
+
+def paypal_checkout(n: int) -> None:
+    for i in range(n):
+        with cache.request_scope():
+            core.reserve_spot(spot_id(i))
+        with cache.request_scope():
+            transaction_ref, _ = core.create_transaction(spot_id(i), backends.BUYER_ID, payment_provider="paypal")
+        with cache.request_scope():
+            order_id = paypal.create_order(transaction_ref.id)["id"]
+        with cache.request_scope():
+            aio.run(aio.paypal_book_spot(spot_id(i), transaction_ref.id, order_id))
+
+
+def reduce_prices(n: int) -> None:
+    for seller_price in PRICE_STEPS:
+        for i in range(n):
+            with cache.request_scope():
+                core.update_spot(spot_id(i), 50, seller_price)
+    with mock.patch.object(config, "PRICE_NOTIFICATION_DELAY", 0):
+        core.send_price_notifications()
+
+
+def payout(_n: int) -> None:
+    core.pay_sellers()
+
+
+def refund(_n: int) -> None:
+    core.refund_buyers()
+
+
+def free(_n: int) -> None:
+    core.free_spots()
+
+
+def is_refunded(transaction: dict) -> bool:
+    if transaction["paymentProvider"] == "stripe":
+        return transaction["status"] == "to_refund"  # refunded once Stripe sends the charge.refunded webhook
+    return transaction["status"] == "payment_refunded"
+
+
+def check_stripe_refunds(backends_: backends.Backends) -> None:
+    transactions_ = backends_.db.documents.get("transactions", {})
+    expected = sorted(
+        (document.data["paymentIntentId"], providers.idempotency_key("refund", transaction_id_))
+        for transaction_id_, document in transactions_.items()
+        if document.data["paymentProvider"] == "stripe"
+    )
+    refunds = sorted(
+        (call.kwargs["payment_intent"], call.kwargs["idempotency_key"])
+        for call in backends_.stripe.Refund.create.call_args_list
+    )
+    if refunds != expected:
+        raise AssertionError(f"Issued {len(refunds)} Stripe refunds, expected one for each of {len(expected)}.")
+
+
+FLOWS = {
+    "reserve": Flow(available_spots, reserve, "spots", lambda spot: spot["status"] == "reserved"),
+    "stripe_checkout": Flow(available_spots, stripe_checkout, "spots", lambda spot: spot["status"] == "sold"),
+    "paypal_checkout": Flow(available_spots, paypal_checkout, "spots", lambda spot: spot["status"] == "sold"),
+    "price_reduction": Flow(
+        available_spots, reduce_prices, "spots", lambda spot: spot["sellerPrice"] == PRICE_STEPS[-1]
+    ),
+    "payout": Flow(
+        sold_spots, payout, "transactions", lambda transaction: transaction["payout_status"] == "payout_initiated"
+    ),
+    "refund": Flow(spots_to_refund, refund, "transactions", is_refunded, check_stripe_refunds),
+    "free_spots": Flow(reserved_spots, free, "spots", lambda spot: spot["status"] == "available"),
+}
+
+
+def measure_flow(name: str, size: int = DEFAULT_SIZE, iterations: int = 5) -> dict:
+    flow = FLOWS[name]
+    unlimited = {
+        provider: workers.ProviderLimit(limit.max_workers, float("inf"))
+        for provider, limit in core.REFUND_LIMITS.items()
+    }
+    timings = []
+    with contextlib.ExitStack() as stack:
+        backends_ = stack.enter_context(backends.mocked_backends())
+        stack.enter_context(mock.patch.dict(core.REFUND_LIMITS, unlimited))
+        devnull = stack.enter_context(open(os.devnull, "w", encoding="utf-8"))
+        for _ in range(iterations):
+            backends_.reset(flow.documents(size))
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+                flow.run(size)
+            timings.append(time.perf_counter() - start)
+            check_outcome(backends_, flow, size)
+        operations = backends_.operations()
+    median = statistics.median(timings)
+    return {
+        "flow": name,
+        "size": size,
+        "iterations": iterations,
+        "median_ms": median * 1000,
+        "throughput_per_s": size / median,
+        "operations": operations,
+        "operations_per_item": {key: value / size for key, value in operations.items()},
+    }
+
+
+def check_outcome(backends_: backends.Backends, flow: Flow, size: int) -> None:
+    documents = backends_.db.documents.get(flow.collection, {})
+    n_done = sum(1 for document in documents.values() if flow.is_done(document.data))
+    if n_done < size:
+        raise AssertionError(f"Only {n_done} of {size} {flow.collection} completed the flow.")
+    if flow.check is not None:
+        flow.check(backends_)
@@ -0,0 +1,100 @@
+import contextlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any
+from unittest import mock
+
+from benchmark import backends
+
+HANDLERS: dict[str, tuple[str, Any]] = {
+    "update_spot": ("https", {"spotId": backends.SPOT_ID, "progress": 70, "sellerPrice": 9}),
+    "accept_suggested_price": ("https", {"spotId": backends.SPOT_ID, "sellerPrice": 9}),
+    "suggest_price": ("https", {"spotId": backends.SPOT_ID, "buyerPrice": 10}),
+    "report_issue": ("https", {"spotId": backends.SPOT_ID}),
+    "delete_user": ("https", {}),
+    "reserve_spot": ("https", {"spotId": backends.SPOT_ID}),
+    "stripe_payment_sheet": ("https", {"spotId": backends.SPOT_ID}),
+    "stripe_book_spot": ("https", {"spotId": backends.SPOT_ID, "transactionId": backends.TRANSACTION_ID}),
+    "paypal_create_transaction": ("https", {"spotId": backends.SPOT_ID}),
+    "paypal_create_order": ("https", {"transactionId": backends.TRANSACTION_ID}),
+    "paypal_book_spot": (
+        "https",
+        {"spotId": backends.SPOT_ID, "transactionId": backends.TRANSACTION_ID, "orderId": "order1"},
+    ),
+    "free_spots": ("schedule", None),
+    "send_price_notifications": ("schedule", None),
+    "refund_buyers": ("schedule", None),
+    "pay_sellers": ("schedule", None),
+    "send_ops_digest": ("schedule", None),
+    "send_email": (
+        "pubsub",
+        {"to": "a@example.com", "subject": "Spot Sold", "body": "", "template": "spot_sold", "variables": {}},
+    ),
+    "send_notification": (
+        "pubsub",
+        {
+            "userIds": [backends.SELLER_ID, backends.BUYER_ID],
+            "title": "Sale",
+            "body": "",
+            "data": {"type": "sold_spot"},
+        },
+    ),
+}
+
+
+def measure_handler(name: str, iterations: int) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmark.handlers", name, str(iterations)],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def run_handler(name: str, iterations: int) -> dict:
+    start = time.perf_counter()
+    import main  # pylint: disable=import-outside-toplevel
+
+    import_ms = (time.perf_counter() - start) * 1000
+    kind, payload = HANDLERS[name]
+    timings = []
+    with open(os.devnull, "w", encoding="utf-8") as devnull, backends.mocked_backends() as backends_:
+        for _ in range(iterations + 1):
+            backends_.reset(backends.sample_documents())
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+                call_handler(getattr(main, name).__wrapped__, kind, payload)
+            timings.append((time.perf_counter() - start) * 1000)
+    steady_state = sorted(timings[1:])
+    return {
+        "handler": name,
+        "import_main_ms": import_ms,
+        "first_call_ms": timings[0],
+        "steady_state_median_ms": statistics.median(steady_state),
+        "steady_state_p95_ms": steady_state[int(0.95 * (len(steady_state) - 1))],
+        "iterations": iterations,
+        "operations": backends_.operations(),
+    }
+
+
+def call_handler(handler: Any, kind: str, payload: Any) -> None:
+    if kind == "https":
+        request = mock.Mock(headers={"Authorization": "Bearer token"})
+        request.get_json.side_effect = lambda: dict(payload)
+        handler(request)
+    elif kind == "pubsub":
+        event = mock.Mock()
+        event.data.message.json = payload
+        handler(event)
+    else:
+        handler(mock.Mock())
+
+
+if __name__ == "__main__":
+    print(json.dumps(run_handler(sys.argv[1], int(sys.argv[2]))))
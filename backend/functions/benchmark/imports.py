@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+MODULES = [
+    "main",
+    "taqo.core",
+    "taqo.utils",
+    "taqo.paypal",
+    "taqo.stripe_utils",
+    "stripe",
+    "markdown2",
+    "requests",
+    "google.cloud.pubsub_v1",
+    "firebase_admin.firestore",
+    "firebase_admin.messaging",
+    "firebase_functions.https_fn",
+]
+N_HEAVIEST = 10
+
+
+def measure_import(module: str, repeat: int = 3) -> dict:
+    runs = [parse_importtime(run_importtime(module)) for _ in range(repeat)]
+    entries = min(runs, key=lambda entries_: entries_[-1]["cumulative_us"])
+    return {
+        "module": module,
+        "cumulative_us": entries[-1]["cumulative_us"],
+        "self_us": entries[-1]["self_us"],
+        "heaviest": sorted(entries, key=lambda entry: entry["self_us"], reverse=True)[:N_HEAVIEST],
+    }
+
+
+def run_importtime(module: str) -> str:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    return result.stderr
+
+
+def parse_importtime(output: str) -> list[dict]:
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        entries.append({"name": name.strip(), "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    return entries
@@ -1,20 +1,23 @@
+# pylint: disable=import-outside-toplevel
 import firebase_admin
-import stripe
-from firebase_functions import https_fn, logger, pubsub_fn, scheduler_fn
+from firebase_functions import https_fn, logger, pubsub_fn, scheduler_fn, tasks_fn
 from firebase_functions.firestore_fn import DocumentSnapshot, Event, on_document_created
+from firebase_functions.options import RetryConfig
 
 firebase_admin.initialize_app()
 
 from taqo import (  # noqa: E402 pylint: disable=wrong-import-position
     config,
-    core,
-    paypal,
-    stripe_utils,
+    metrics,
     utils,
 )
 
+metrics.instrument()
+
 
 @on_document_created(document="spots/{spotId}", region=config.REGION)  # type: ignore
+@metrics.measured
+@utils.message_scoped
 def set_buyer_price(event: Event[DocumentSnapshot]) -> None:
     new_value = event.data
     seller_price = new_value.get("sellerPrice")
@@ -24,6 +27,8 @@ def set_buyer_price(event: Event[DocumentSnapshot]) -> None:
 @https_fn.on_request(region=config.REGION)
 @utils.https_wrapper
 def update_spot(data: dict) -> None:
+    from taqo import core
+
     spot_id = data["spotId"]
     progress = data["progress"]
     seller_price = data["sellerPrice"]
@@ -33,6 +38,8 @@ def update_spot(data: dict) -> None:
 @https_fn.on_request(region=config.REGION)
 @utils.https_wrapper
 def accept_suggested_price(data: dict) -> None:
+    from taqo import core
+
     spot_id = data["spotId"]
     seller_price = data["sellerPrice"]
     core.accept_suggested_price(spot_id, seller_price)
@@ -41,6 +48,8 @@ def accept_suggested_price(data: dict) -> None:
 @https_fn.on_request(region=config.REGION)
 @utils.https_wrapper
 def suggest_price(data: dict) -> None:
+    from taqo import core
+
     spot_id = data["spotId"]
     user_id = data["userId"]
     buyer_price = data["buyerPrice"]
@@ -50,6 +59,8 @@ def suggest_price(data: dict) -> None:
 @https_fn.on_request(region=config.REGION)
 @utils.https_wrapper
 def report_issue(data: dict) -> None:
+    from taqo import core
+
     spot_id = data["spotId"]
     user_id = data["userId"]
     core.report_issue(spot_id, user_id)
@@ -58,12 +69,16 @@ def report_issue(data: dict) -> None:
 @https_fn.on_request(region=config.REGION)
 @utils.https_wrapper
 def delete_user(data: dict) -> None:
+    from taqo import core
+
     core.delete_user(data["userId"])
 
 
 @https_fn.on_request(region=config.REGION)
 @utils.https_wrapper
 def reserve_spot(data: dict) -> None:
+    from taqo import core
+
     try:
         core.reserve_spot(data["spotId"])
     except utils.UpdateError as e:
@@ -73,6 +88,8 @@ def reserve_spot(data: dict) -> None:
 @https_fn.on_request(region=config.REGION)
 @utils.https_wrapper
 def free_spot(data: dict) -> None:
+    from taqo import core
+
     try:
         core.free_spot(data["spotId"])
     except utils.UpdateError as e:
@@ -81,17 +98,43 @@ def free_spot(data: dict) -> None:
         ) from e
 
 
-@scheduler_fn.on_schedule(region=config.REGION, schedule="* * * * *")
+@tasks_fn.on_task_dispatched(region=config.REGION, retry_config=RetryConfig(max_attempts=5, min_backoff_seconds=10))
+@metrics.measured
+@utils.message_scoped
+def expire_reservation(req: tasks_fn.CallableRequest) -> None:
+    from taqo import core
+
+    core.expire_reservation(req.data)
+
+
+@scheduler_fn.on_schedule(region=config.REGION, schedule="*/15 * * * *")
+@metrics.measured
+@utils.message_scoped
 def free_spots(_event: scheduler_fn.ScheduledEvent) -> None:
+    from taqo import core
+
     core.free_spots()
 
 
+@scheduler_fn.on_schedule(region=config.REGION, schedule="* * * * *")
+@metrics.measured
+@utils.message_scoped
+def send_price_notifications(_event: scheduler_fn.ScheduledEvent) -> None:
+    from taqo import core
+
+    core.send_price_notifications()
+
+
 @scheduler_fn.on_schedule(
     region=config.REGION,
     schedule="*/5 * * * *",
     secrets=["STRIPE_API_KEY", "PAYPAL_CLIENT_SECRET"],
 )
+@metrics.measured
+@utils.message_scoped
 def refund_buyers(_event: scheduler_fn.ScheduledEvent) -> None:
+    from taqo import core
+
     core.refund_buyers()
 
 
@@ -100,29 +143,48 @@ def refund_buyers(_event: scheduler_fn.ScheduledEvent) -> None:
     schedule="0 * * * *",
     secrets=["PAYPAL_CLIENT_SECRET"],
 )
+@metrics.measured
+@utils.message_scoped
 def pay_sellers(_event: scheduler_fn.ScheduledEvent) -> None:
+    from taqo import core
+
     core.pay_sellers()
 
 
+@scheduler_fn.on_schedule(region=config.REGION, schedule="0 * * * *")
+@metrics.measured
+@utils.message_scoped
+def send_ops_digest(_event: scheduler_fn.ScheduledEvent) -> None:
+    from taqo import ops
+
+    ops.send_digest()
+
+
 @https_fn.on_request(region=config.REGION, secrets=["STRIPE_API_KEY"])
 @utils.https_wrapper
 def stripe_payment_sheet(data: dict) -> dict:
+    from taqo import aio
+
     spot_id = data["spotId"]
     buyer_id = data["userId"]
-    return stripe_utils.payment_sheet(spot_id, buyer_id)
+    return aio.run(aio.payment_sheet(spot_id, buyer_id))
 
 
 @https_fn.on_request(region=config.REGION)
 @utils.https_wrapper
 def stripe_book_spot(data: dict) -> None:
+    from taqo import aio
+
     spot_id = data["spotId"]
     transaction_id = data["transactionId"]
-    core.stripe_book_spot(spot_id, transaction_id)
+    aio.run(aio.stripe_book_spot(spot_id, transaction_id))
 
 
 @https_fn.on_request(region=config.REGION)
 @utils.https_wrapper
 def paypal_create_transaction(data: dict) -> dict[str, str]:
+    from taqo import core
+
     spot_id = data["spotId"]
     buyer_id = data["userId"]
     transaction_ref, _ = core.create_transaction(spot_id, buyer_id, payment_provider="paypal")
@@ -132,6 +194,8 @@ def paypal_create_transaction(data: dict) -> dict[str, str]:
 @https_fn.on_request(region=config.REGION, cors=utils.cors_options, secrets=["PAYPAL_CLIENT_SECRET"])
 @utils.https_wrapper
 def paypal_create_order(data: dict) -> dict:
+    from taqo import paypal
+
     transaction_id = data["transactionId"]
     return paypal.create_order(transaction_id)
 
@@ -139,24 +203,35 @@ def paypal_create_order(data: dict) -> dict:
 @https_fn.on_request(region=config.REGION, cors=utils.cors_options, secrets=["PAYPAL_CLIENT_SECRET"])
 @utils.https_wrapper
 def paypal_book_spot(data: dict) -> None:
+    from taqo import aio
+
     spot_id = data["spotId"]
     transaction_id = data["transactionId"]
     order_id = data["orderId"]
-    core.paypal_book_spot(spot_id, transaction_id, order_id)
+    aio.run(aio.paypal_book_spot(spot_id, transaction_id, order_id))
 
 
 @https_fn.on_request(region=config.REGION, secrets=["STRIPE_ENDPOINT_SECRET"])
+@metrics.measured
+@utils.message_scoped
 def stripe_webhook(req: https_fn.Request) -> https_fn.Response:
+    from taqo import clients, stripe_utils
+
+    stripe = clients.get("stripe")
     try:
         event = stripe.Webhook.construct_event(req.data, req.headers["Stripe-Signature"], config.STRIPE_ENDPOINT_SECRET)
-    except (ValueError, stripe.error.SignatureVerificationError):  # type: ignore
+    except (ValueError, stripe.error.SignatureVerificationError):
         logger.error("Invalid signature")
         return https_fn.Response("ff_error/invalid_signature", status=400)
     return stripe_utils.handle_webhook(event)
 
 
 @https_fn.on_request(region=config.REGION, secrets=["PAYPAL_CLIENT_SECRET"])
+@metrics.measured
+@utils.message_scoped
 def paypal_webhook(req: https_fn.Request) -> https_fn.Response:
+    from taqo import paypal
+
     try:
         paypal.verify_webhook_signature(req)
     except AssertionError:
@@ -166,13 +241,27 @@ def paypal_webhook(req: https_fn.Request) -> https_fn.Response:
     return paypal.handle_webhook(event)
 
 
-@pubsub_fn.on_message_published(topic="send-email", region=config.REGION, secrets=["MAILGUN_API_KEY"])
+@pubsub_fn.on_message_published(topic="send-email", region=config.REGION, secrets=["MAILGUN_API_KEY"], retry=True)
+@metrics.measured
+@utils.message_scoped
 def send_email(event: pubsub_fn.CloudEvent[pubsub_fn.MessagePublishedData]) -> None:
+    from taqo import breaker, providers
+
     data = event.data.message.json
-    utils.send_email(data["to"], data["subject"], data["body"])  # type: ignore
+    try:
+        if "template" in data:  # type: ignore
+            utils.send_template_email(data["to"], data["subject"], data["template"], data["variables"])  # type: ignore
+        else:
+            utils.send_email(data["to"], data["subject"], data["body"])  # type: ignore
+    except Exception as e:
+        if isinstance(e, breaker.CircuitOpenError) or providers.is_transient(e):
+            raise  # redelivered by Pub/Sub once Mailgun recovers
+        logger.error(utils.error_to_str(e))
 
 
 @pubsub_fn.on_message_published(topic="send-notification", region=config.REGION)
+@metrics.measured
+@utils.message_scoped
 def send_notification(event: pubsub_fn.CloudEvent[pubsub_fn.MessagePublishedData]) -> None:
     data = event.data.message.json
     utils.send_notification(data["userIds"], data["title"], data["body"], data["data"])  # type: ignore
@@ -0,0 +1,146 @@
+# pylint: disable=import-outside-toplevel
+import asyncio
+import concurrent.futures
+from typing import Any, Coroutine, Optional, TypeVar
+
+from firebase_functions import https_fn, logger
+from taqo import (
+    cache,
+    clients,
+    config,
+    core,
+    http_client,
+    paypal,
+    providers,
+    stripe_utils,
+    utils,
+)
+
+T = TypeVar("T")
+
+
+def run(coroutine: Coroutine[Any, Any, T]) -> T:
+    return asyncio.run_coroutine_threadsafe(coroutine, clients.get("event_loop")).result()
+
+
+def get_db() -> Any:
+    return clients.get("firestore_async")
+
+
+async def payment_sheet(spot_id: str, buyer_id: str) -> dict:
+    stripe = clients.get("stripe")
+    customer_id, (transaction_ref, transaction) = await asyncio.gather(
+        get_stripe_customer_id(buyer_id),
+        create_transaction(spot_id, buyer_id, payment_provider="stripe"),
+    )
+    ephemeral_key, payment_intent = await asyncio.gather(
+        stripe.EphemeralKey.create_async(customer=customer_id, stripe_version=stripe_utils.STRIPE_VERSION),
+        providers.call_async(
+            "stripe.payment_intent",
+            lambda: stripe.PaymentIntent.create_async(
+                amount=int(transaction["buyerPrice"] * 100),
+                currency="eur",
+                customer=customer_id,
+                metadata={"transactionId": transaction_ref.id},
+                idempotency_key=providers.idempotency_key("payment-intent", transaction_ref.id),
+            ),
+        ),
+    )
+    await transaction_ref.update({"paymentIntentId": payment_intent.id})
+    return {
+        "paymentIntentClientSecret": payment_intent.client_secret,
+        "transactionId": transaction_ref.id,
+        "ephemeralKey": ephemeral_key.secret,
+        "customer": customer_id,
+    }
+
+
+async def get_stripe_customer_id(user_id: str) -> str:
+    user_ref = get_db().collection("users").document(user_id)
+    user_doc = await user_ref.get()
+    if user_doc.exists and "stripeCustomerId" in user_doc.to_dict():
+        return user_doc.get("stripeCustomerId")
+    customer = await clients.get("stripe").Customer.create_async()
+    customer_id = customer["id"]
+    await user_ref.set({"stripeCustomerId": customer_id})
+    cache.invalidate("users", user_id)
+    return customer_id
+
+
+async def create_transaction(spot_id: str, buyer_id: str, payment_provider: str) -> tuple[Any, dict]:
+    spot_doc = await get_db().collection("spots").document(spot_id).get()
+    transaction = core.new_transaction(spot_id, spot_doc.to_dict(), buyer_id, payment_provider)
+    _, transaction_ref = await get_db().collection("transactions").add(transaction)
+    return transaction_ref, transaction
+
+
+async def stripe_book_spot(spot_id: str, transaction_id: str) -> None:
+    error = await book_spot(spot_id, transaction_id, sell=True, initiate_refund=True)
+    if error:
+        raise https_fn.HttpsError(message=f"ff_error/{error}", code=https_fn.FunctionsErrorCode.ABORTED)
+    await notify_stakeholders(spot_id, transaction_id)
+
+
+async def paypal_book_spot(spot_id: str, transaction_id: str, order_id: str) -> None:
+    error = await book_spot(spot_id, transaction_id, sell=False, initiate_refund=False)
+    if error:
+        raise https_fn.HttpsError(message=f"ff_error/{error}", code=https_fn.FunctionsErrorCode.ABORTED)
+    await capture_order(transaction_id, order_id)
+    if await book_spot(spot_id, transaction_id, sell=True, initiate_refund=True):
+        raise https_fn.HttpsError(message="ff_error/spot_unavailable/charged", code=https_fn.FunctionsErrorCode.ABORTED)
+    await notify_stakeholders(spot_id, transaction_id)
+
+
+async def book_spot(spot_id: str, transaction_id: str, sell: bool, initiate_refund: bool) -> Optional[str]:
+    from firebase_admin import firestore_async
+
+    db = get_db()
+    spot_ref = db.collection("spots").document(spot_id)
+    transaction_ref = db.collection("transactions").document(transaction_id)
+
+    @firestore_async.async_transactional  # type: ignore  # pylint: disable=no-member
+    async def book_in_transaction(transaction_):
+        spot = await spot_ref.get(transaction=transaction_)
+        transaction_doc = await transaction_ref.get(transaction=transaction_)
+        return spot, transaction_doc, *core.stage_booking(transaction_, spot, transaction_doc, sell, initiate_refund)
+
+    spot, transaction_doc, spot_update, transaction_update, error = await book_in_transaction(db.transaction())
+    core.record_booking(spot, transaction_doc, spot_update, transaction_update)
+    if "reservedAt" in spot_update:
+        await asyncio.to_thread(core.schedule_expiry, spot_id, spot_update["reservedAt"])
+    return error
+
+
+async def capture_order(transaction_id: str, order_id: str) -> None:
+    headers = await asyncio.to_thread(paypal.get_headers, providers.idempotency_key("capture", transaction_id))
+    url = f"{config.PAYPAL_ORDERS_URL}/{order_id}/capture"
+    response = await providers.call_async("paypal.capture", lambda: post_capture(url, headers))
+    update_data = paypal.get_capture_update(response.json())
+    await get_db().collection("transactions").document(transaction_id).update(update_data)
+    cache.invalidate("transactions", transaction_id)
+    if "captureId" not in update_data:
+        raise https_fn.HttpsError(message="ff_error/payment_failed", code=https_fn.FunctionsErrorCode.ABORTED)
+
+
+async def post_capture(url: str, headers: dict[str, str]) -> Any:
+    return providers.check_response(await http_client.post_async(url, headers=headers))
+
+
+async def notify_stakeholders(spot_id: str, transaction_id: str) -> None:
+    try:
+        seller_futures, buyer_future, _ = await asyncio.gather(
+            asyncio.to_thread(core.notify_seller_of_sale, spot_id),
+            asyncio.to_thread(core.notify_buyer_of_sale, transaction_id),
+            asyncio.to_thread(core.notify_operators_of_sale, spot_id, transaction_id),
+        )
+    except Exception as e:
+        logger.error(utils.error_to_str(e))
+        return
+    await resolve_futures(*seller_futures, buyer_future)
+
+
+async def resolve_futures(*futures: Any) -> None:
+    pending = [asyncio.wrap_future(future_) for future_ in futures if isinstance(future_, concurrent.futures.Future)]
+    for result in await asyncio.gather(*pending, return_exceptions=True):
+        if isinstance(result, Exception):
+            logger.error(utils.error_to_str(result))
@@ -0,0 +1,138 @@
+import asyncio
+import collections
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, TypeVar
+
+from firebase_admin import firestore
+from firebase_functions import logger
+from google.api_core import exceptions
+
+WINDOW = 60  # seconds of outcomes that count towards the failure rate
+MIN_CALLS = 5
+FAILURE_RATE = 0.5
+OPEN_DURATION = 30  # seconds before a half-open trial call is allowed
+TRIAL_TIMEOUT = 30  # seconds before a trial that never reported back is given up
+STATE_REFRESH = 10  # seconds the shared state is cached per instance
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+@dataclass
+class Breaker:
+    provider: str
+    outcomes: collections.deque[tuple[float, bool]] = field(default_factory=collections.deque)
+    state: str = "closed"
+    until: float = 0.0
+    update_time: Any = None
+    refreshed_at: float = float("-inf")
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def get_ref(self) -> Any:
+        return firestore.client().collection("breakers").document(self.provider)
+
+    def refresh(self, force: bool = False) -> None:
+        if not force and time.monotonic() - self.refreshed_at < STATE_REFRESH:
+            return
+        snapshot = self.get_ref().get()
+        data = snapshot.to_dict() if snapshot.exists else {}
+        self.state, self.until = data.get("state", "closed"), data.get("until", 0.0)
+        self.update_time = snapshot.update_time if snapshot.exists else None
+        self.refreshed_at = time.monotonic()
+
+    def is_open(self) -> bool:
+        with self.lock:
+            self.refresh()
+            return self.state != "closed" and time.time() < self.until
+
+    def before_call(self) -> bool:
+        with self.lock:
+            self.refresh()
+            if self.state == "closed":
+                return False
+            if time.time() < self.until:
+                raise CircuitOpenError(f"Circuit for {self.provider} is {self.state.replace('_', '-')}.")
+            if self.set_state("half_open", TRIAL_TIMEOUT, precondition=True):
+                return True
+            raise CircuitOpenError(f"Circuit for {self.provider} is half-open.")
+
+    def record(self, failed: bool, trial: bool) -> None:
+        now = time.monotonic()
+        with self.lock:
+            if trial:
+                self.outcomes.clear()
+                self.set_state("open" if failed else "closed", OPEN_DURATION if failed else 0)
+                return
+            self.outcomes.append((now, failed))
+            while self.outcomes and self.outcomes[0][0] < now - WINDOW:
+                self.outcomes.popleft()
+            n_failures = sum(failed_ for _, failed_ in self.outcomes)
+            if len(self.outcomes) >= MIN_CALLS and n_failures / len(self.outcomes) >= FAILURE_RATE:
+                self.outcomes.clear()
+                self.set_state("open", OPEN_DURATION)
+
+    def set_state(self, state: str, duration: float, precondition: bool = False) -> bool:
+        until = time.time() + duration
+        data = {"state": state, "until": until}
+        try:
+            if precondition and self.update_time is not None:
+                option = firestore.client().write_option(last_update_time=self.update_time)
+                result = self.get_ref().update(data, option=option)
+            else:
+                result = self.get_ref().set(data)
+        except (exceptions.FailedPrecondition, exceptions.NotFound):
+            self.refresh(force=True)
+            return False
+        self.state, self.until, self.update_time = state, until, result.update_time
+        self.refreshed_at = time.monotonic()
+        logger.log(f"Circuit for {self.provider} is {state.replace('_', '-')}.")
+        return True
+
+
+breakers: dict[str, Breaker] = {}
+breakers_lock = threading.Lock()
+
+
+def get(provider: str) -> Breaker:
+    if provider not in breakers:
+        with breakers_lock:
+            breakers.setdefault(provider, Breaker(provider))
+    return breakers[provider]
+
+
+def is_open(provider: str) -> bool:
+    return get(provider).is_open()
+
+
+def call(provider: str, func: Callable[[], T], is_failure: Callable[[Exception], bool]) -> T:
+    breaker_ = get(provider)
+    trial = breaker_.before_call()
+    try:
+        result = func()
+    except Exception as e:
+        breaker_.record(is_failure(e), trial)
+        raise
+    breaker_.record(False, trial)
+    return result
+
+
+async def call_async(provider: str, func: Callable[[], Awaitable[T]], is_failure: Callable[[Exception], bool]) -> T:
+    breaker_ = get(provider)
+    trial = await asyncio.to_thread(breaker_.before_call)
+    try:
+        result = await func()
+    except Exception as e:
+        await asyncio.to_thread(breaker_.record, is_failure(e), trial)
+        raise
+    await asyncio.to_thread(breaker_.record, False, trial)
+    return result
+
+
+def reset() -> None:
+    with breakers_lock:
+        breakers.clear()
@@ -0,0 +1,63 @@
+import contextlib
+import contextvars
+from typing import Any, Iterator, Optional
+
+from firebase_admin import firestore
+
+documents: contextvars.ContextVar[Optional[dict[tuple[str, str], firestore.DocumentSnapshot]]] = contextvars.ContextVar(
+    "documents", default=None
+)
+
+
+@contextlib.contextmanager
+def request_scope() -> Iterator[None]:
+    token = documents.set({})
+    try:
+        yield
+    finally:
+        documents.reset(token)
+
+
+def get(collection: str, document_id: str) -> firestore.DocumentSnapshot:
+    cached = documents.get()
+    key = (collection, document_id)
+    if cached is not None and key in cached:
+        return cached[key]
+    snapshot = firestore.client().collection(collection).document(document_id).get()
+    put(collection, document_id, snapshot)
+    return snapshot
+
+
+def put(collection: str, document_id: str, snapshot: firestore.DocumentSnapshot) -> None:
+    cached = documents.get()
+    if cached is not None:
+        cached[(collection, document_id)] = snapshot
+
+
+def apply_update(collection: str, document_id: str, update_data: dict) -> None:
+    cached = documents.get()
+    key = (collection, document_id)
+    if cached is None or key not in cached:
+        return
+    snapshot = cached[key]
+    if snapshot.exists and all(is_plain_field(path, value) for path, value in update_data.items()):
+        cached[key] = firestore.DocumentSnapshot(
+            snapshot.reference,
+            {**snapshot.to_dict(), **update_data},
+            exists=True,
+            read_time=snapshot.read_time,
+            create_time=snapshot.create_time,
+            update_time=snapshot.update_time,
+        )
+    else:
+        del cached[key]
+
+
+def invalidate(collection: str, document_id: str) -> None:
+    cached = documents.get()
+    if cached is not None:
+        cached.pop((collection, document_id), None)
+
+
+def is_plain_field(path: str, value: Any) -> bool:
+    return "." not in path and isinstance(value, (str, int, float, bool, type(None)))
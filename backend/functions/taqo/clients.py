@@ -0,0 +1,85 @@
+# pylint: disable=import-outside-toplevel
+import asyncio
+import threading
+from typing import Any, Callable
+
+from taqo import config, metrics
+
+initializers: dict[str, Callable[[], Any]] = {}
+instances: dict[str, Any] = {}
+lock = threading.Lock()
+
+PUBLISH_BATCH_SETTINGS = {"max_messages": 100, "max_bytes": 1024 * 1024, "max_latency": 0.01}
+
+DEFAULT_POOL_SIZE = 10
+PAYPAL_POOL_SIZE = 20
+MAILGUN_POOL_SIZE = 10
+
+
+def register(name: str) -> Callable[[Callable[[], Any]], Callable[[], Any]]:
+    def decorator(initializer: Callable[[], Any]) -> Callable[[], Any]:
+        initializers[name] = initializer
+        return initializer
+
+    return decorator
+
+
+def get(name: str) -> Any:
+    if name in instances:
+        return instances[name]
+    with lock:
+        if name not in instances:
+            instances[name] = initializers[name]()
+        return instances[name]
+
+
+@register("stripe")
+def init_stripe() -> Any:
+    import stripe
+
+    stripe.api_key = config.STRIPE_API_KEY
+    return stripe
+
+
+@register("publisher")
+def init_publisher() -> Any:
+    from google.cloud import pubsub_v1  # type: ignore
+
+    return pubsub_v1.PublisherClient(batch_settings=pubsub_v1.types.BatchSettings(**PUBLISH_BATCH_SETTINGS))
+
+
+@register("http_session")
+def init_http_session() -> Any:
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_maxsize=DEFAULT_POOL_SIZE))
+    for url, pool_size in ((config.PAYPAL_BASE_URL, PAYPAL_POOL_SIZE), (config.MAILGUN_URL, MAILGUN_POOL_SIZE)):
+        if url:
+            prefix = "/".join(url.split("/")[:3])
+            session.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    return session
+
+
+@register("event_loop")
+def init_event_loop() -> asyncio.AbstractEventLoop:
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="event-loop", daemon=True).start()
+    return loop
+
+
+@register("firestore_async")
+def init_firestore_async() -> Any:
+    from firebase_admin import firestore_async
+
+    if metrics.instrumented.is_set():
+        metrics.instrument_async()
+    return firestore_async.client()
+
+
+@register("async_http_client")
+def init_async_http_client() -> Any:
+    import httpx
+
+    return httpx.AsyncClient(limits=httpx.Limits(max_connections=PAYPAL_POOL_SIZE))
@@ -5,11 +5,14 @@ ENV = "" if os.getenv("ENVIRONMENT") == "prod" else "_DEV"
 REGION = os.getenv("REGION")  # e.g., europe-west3
 SERVICE_FEE = float(os.getenv("SERVICE_FEE"))  # type: ignore  # e.g., 0.25
 TIMEOUT = int(os.getenv("TIMEOUT"))  # type: ignore  # e.g, 10
+TASK_QUEUE = os.getenv("TASK_QUEUE", "cloud_tasks")  # cloud_tasks or local
+PRICE_NOTIFICATION_DELAY = int(os.getenv("PRICE_NOTIFICATION_DELAY", "2"))  # minutes
 
 MAILGUN_URL = os.getenv("MAILGUN_URL")  # e.g., https://api.mailgun.net/v3/FF_REDACTED/messages
 MAILGUN_API_KEY = os.getenv("MAILGUN_API_KEY" + ENV)
 OUTBOUND_EMAIL = os.getenv("OUTBOUND_EMAIL")
 OPS_EMAIL = os.getenv("OPS_EMAIL" + ENV)
+OPS_ALERT_THRESHOLD = int(os.getenv("OPS_ALERT_THRESHOLD", "5"))  # failures since the last digest
 
 STRIPE_API_KEY = os.getenv("STRIPE_API_KEY" + ENV)
 STRIPE_ENDPOINT_SECRET = os.getenv("STRIPE_ENDPOINT_SECRET" + ENV)
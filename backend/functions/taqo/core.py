@@ -1,17 +1,39 @@
-import textwrap
-from typing import Any
+import math
+from typing import Any, Optional
 
 import firebase_admin
-import stripe
 from firebase_admin import firestore
 from firebase_functions import https_fn, logger
-from google.api_core import future
-from taqo import config, paypal, utils
-
-stripe.api_key = config.STRIPE_API_KEY
+from google.api_core import exceptions, future
+from google.cloud.firestore_v1.bulk_writer import BulkWriteFailure, BulkWriter
+from google.cloud.firestore_v1.types.write import WriteResult
+from google.rpc import code_pb2  # type: ignore
+from taqo import (
+    breaker,
+    cache,
+    clients,
+    config,
+    lease,
+    ops,
+    paypal,
+    providers,
+    scan,
+    tasks,
+    utils,
+    workers,
+)
+
+RESERVATION_TTL = 5  # minutes
+LEASE_MARGIN = 30  # seconds a lease outlives the scan's time budget
+
+REFUND_LIMITS = {
+    "stripe": workers.ProviderLimit(max_workers=10, requests_per_second=25),
+    "paypal": workers.ProviderLimit(max_workers=5, requests_per_second=10),
+}
 
 
 def update_spot(spot_id: str, progress: int, seller_price: int) -> None:
+    previous_buyer_price = cache.get("spots", spot_id).get("buyerPrice")
     notify_buyers = has_price_reduced(spot_id, seller_price)
     buyer_price = utils.add_service_fee(seller_price)
     update = {
@@ -24,22 +46,52 @@ def update_spot(spot_id: str, progress: int, seller_price: int) -> None:
     except utils.UpdateError as e:
         raise https_fn.HttpsError(message="ff_error/spot_unavailable", code=https_fn.FunctionsErrorCode.ABORTED) from e
     if notify_buyers:
-        notify_interested_buyers(spot_id, buyer_price)
+        schedule_price_notification(spot_id, previous_buyer_price)
 
 
 def has_price_reduced(spot_id: str, new_seller_price: int) -> bool:
-    db = firestore.client()
-    spot_ref = db.collection("spots").document(spot_id)
-    old_seller_price = spot_ref.get().get("sellerPrice")
+    old_seller_price = cache.get("spots", spot_id).get("sellerPrice")
     price_reduced = new_seller_price < old_seller_price
     return price_reduced
 
 
 @utils.tame_errors
-def notify_interested_buyers(spot_id: str, buyer_price: float) -> None:
+def schedule_price_notification(spot_id: str, previous_buyer_price: float) -> None:
     db = firestore.client()
-    spot_ref = db.collection("spots").document(spot_id)
-    spot = spot_ref.get().to_dict()
+    pending_ref = db.collection("price_notifications").document(spot_id)
+    try:
+        pending_ref.create({"previousBuyerPrice": previous_buyer_price, "updatedAt": utils.timestamp()})
+    except exceptions.AlreadyExists:
+        pending_ref.update({"updatedAt": utils.timestamp()})
+
+
+def send_price_notifications() -> None:
+    db = firestore.client()
+    query = db.collection("price_notifications").where(
+        "updatedAt", "<=", utils.timestamp(minutes_ago=config.PRICE_NOTIFICATION_DELAY)
+    )
+    with utils.message_scope():
+        for pending in query.stream():
+            try:
+                pending.reference.delete(option=db.write_option(last_update_time=pending.update_time))
+            except (exceptions.FailedPrecondition, exceptions.NotFound):
+                continue  # the price was reduced again, the latest price is sent after the next delay
+            send_price_notification(pending)
+
+
+@utils.tame_errors
+def send_price_notification(pending: firestore.DocumentSnapshot) -> None:
+    spot = cache.get("spots", pending.id)
+    if not spot.exists or spot.get("status") != "available":
+        return
+    buyer_price = spot.get("buyerPrice")
+    if buyer_price < pending.get("previousBuyerPrice"):
+        notify_interested_buyers(pending.id, buyer_price)
+
+
+@utils.tame_errors
+def notify_interested_buyers(spot_id: str, buyer_price: float) -> None:
+    spot = cache.get("spots", spot_id).to_dict()
     try:
         interested_buyer_ids = spot["interestedBuyerIds"]
     except KeyError:
@@ -51,11 +103,12 @@ def notify_interested_buyers(spot_id: str, buyer_price: float) -> None:
         title="Price Update",
         body=body,
         data={"type": "price_reduction", "body": body},
-        block=True,
+        block=False,
     )
 
 
 def accept_suggested_price(spot_id: str, seller_price: int) -> None:
+    previous_buyer_price = cache.get("spots", spot_id).get("buyerPrice")
     buyer_price = utils.add_service_fee(seller_price)
     update = {
         "sellerPrice": seller_price,
@@ -65,19 +118,49 @@ def accept_suggested_price(spot_id: str, seller_price: int) -> None:
         utils.update_spot(spot_id, utils.is_available, update)
     except utils.UpdateError as e:
         raise https_fn.HttpsError(message="ff_error/spot_unavailable", code=https_fn.FunctionsErrorCode.ABORTED) from e
-    notify_interested_buyers(spot_id, buyer_price)
+    if buyer_price < previous_buyer_price:
+        schedule_price_notification(spot_id, previous_buyer_price)
 
 
-def free_spots() -> None:
+def free_spots(batch_size: int = scan.DEFAULT_BATCH_SIZE, time_budget: float = scan.DEFAULT_TIME_BUDGET) -> None:
     db = firestore.client()
-    spots_ref = db.collection("spots")
-    query = spots_ref.where("status", "==", "reserved").where("reservedAt", "<=", utils.timestamp(minutes_ago=5))
-    spots = query.stream()
-    for spot in spots:
+    query = (
+        db.collection("spots")
+        .where("status", "==", "reserved")
+        .where("reservedAt", "<=", utils.timestamp(minutes_ago=RESERVATION_TTL))
+    )
+    bulk_writer = db.bulk_writer()
+    bulk_writer.on_write_result(on_spot_freed)
+    bulk_writer.on_write_error(on_free_spot_error)
+
+    def free_page(spots: list[firestore.DocumentSnapshot], _deadline: float) -> None:
+        for spot in spots:
+            option = db.write_option(last_update_time=spot.update_time)
+            bulk_writer.update(spot.reference, {"status": "available"}, option=option)
+        bulk_writer.flush()
+
+    with lease.held("free_spots", ttl=int(time_budget) + LEASE_MARGIN) as lease_:
+        if lease_ is None:
+            return
         try:
-            free_spot(spot.id)
-        except utils.UpdateError:
-            logger.error(f"Failed to free spot {spot.id}.")
+            scan.Scan("free_spots", query, "reservedAt", batch_size, time_budget).run(free_page)
+        finally:
+            bulk_writer.close()
+
+
+def on_spot_freed(spot_ref: firestore.DocumentReference, _result: WriteResult, _bulk_writer: BulkWriter) -> None:
+    logger.log(f"Spot {spot_ref.id} has been freed.")
+
+
+def on_free_spot_error(error: BulkWriteFailure, _bulk_writer: BulkWriter) -> bool:
+    spot_id = error.operation.reference.id  # type: ignore
+    if error.code == code_pb2.FAILED_PRECONDITION:
+        logger.log(f"Spot {spot_id} changed since it was read and has not been freed.")
+        return False
+    if error.attempts < utils.MAX_WRITE_ATTEMPTS:
+        return True
+    logger.error(f"Failed to free spot {spot_id}.")
+    return False
 
 
 def free_spot(spot_id: str) -> None:
@@ -85,62 +168,138 @@ def free_spot(spot_id: str) -> None:
     logger.log(f"Spot {spot_id} has been freed.")
 
 
-def pay_sellers() -> None:
+def pay_sellers(batch_size: int = scan.DEFAULT_BATCH_SIZE, time_budget: float = scan.DEFAULT_TIME_BUDGET) -> None:
     db = firestore.client()
     transactions_ref = db.collection("transactions")
     query = transactions_ref.where("payout_status", "==", "payout_pending").where(
         "bookedAt", "<=", utils.timestamp(hours_ago=12)
     )
-    transactions = query.stream()
-    for transaction in transactions:
-        try_payout(transaction.id)
+    batch_size = min(batch_size, paypal.MAX_PAYOUT_ITEMS)
+    if breaker.is_open("paypal"):
+        logger.warn("Postponed payouts while PayPal is unavailable.")
+        return
+    with lease.held("pay_sellers", ttl=int(time_budget) + LEASE_MARGIN) as lease_:
+        if lease_ is None:
+            return
+        scan.Scan("pay_sellers", query, "bookedAt", batch_size, time_budget).run(
+            lambda transactions, _deadline: try_payout(lease_, lease.claim(lease_, transactions))
+        )
 
 
-def try_payout(transaction_id: str) -> None:
+def try_payout(lease_: lease.Lease, transactions: list[firestore.DocumentSnapshot]) -> None:
+    if not transactions:
+        return
+    receivers = paypal.get_receivers(transactions)
+    unpayable = [transaction for transaction in transactions if transaction.id not in receivers]
+    if unpayable:
+        logger.error(f"Sellers of transactions {[transaction.id for transaction in unpayable]} have no PayPal email.")
+        fail_payouts(lease_, unpayable)
+    transactions = lease.confirm(lease_, [transaction for transaction in transactions if transaction.id in receivers])
+    if not transactions:
+        return
     try:
-        payout_batch_id = paypal.payout(transaction_id)
-        logger.log(f"Successfully initiated payout for transaction {transaction_id}. Batch ID: {payout_batch_id}.")
+        payout_batch_id = paypal.batch_payout(transactions, receivers)
+    except breaker.CircuitOpenError:
+        logger.warn(f"Postponed payout for {len(transactions)} transactions while PayPal is unavailable.")
+        return
     except Exception as e:
         logger.error(utils.error_to_str(e))
-        utils.update_transaction(transaction_id, update_data={"payout_status": "payout_failed"})
-        utils.enqueue_email(config.OPS_EMAIL, "Payout Failed", f"Transaction ID: {transaction_id}", block=True)
+        fail_payouts(lease_, transactions)
+        return
+    update_data = {"payout_status": "payout_initiated", "payoutBatchId": payout_batch_id}
+    transaction_ids = lease.update(lease_, transactions, update_data)
+    logger.log(f"Successfully initiated payout for {len(transaction_ids)} transactions. Batch ID: {payout_batch_id}.")
+
 
+def fail_payouts(lease_: lease.Lease, transactions: list[firestore.DocumentSnapshot]) -> None:
+    transaction_ids = lease.update(lease_, transactions, update_data={"payout_status": "payout_failed"})
+    if transaction_ids:
+        ops.record_event("Payout Failed", {"Transaction IDs": transaction_ids}, failure=True)
 
-def refund_buyers() -> None:
+
+def refund_buyers(batch_size: int = scan.DEFAULT_BATCH_SIZE, time_budget: float = scan.DEFAULT_TIME_BUDGET) -> None:
     db = firestore.client()
     transactions_ref = db.collection("transactions")
     query = transactions_ref.where("status", "==", "to_refund").where("bookedAt", "<=", utils.timestamp(minutes_ago=2))
-    transactions = query.stream()
-    for transaction in transactions:
-        try_refund(transaction.id)
+    with lease.held("refund_buyers", ttl=int(time_budget) + LEASE_MARGIN) as lease_:
+        if lease_ is None:
+            return
+        scan.Scan("refund_buyers", query, "bookedAt", batch_size, time_budget).run(
+            lambda transactions, deadline: refund_page(lease_, lease.claim(lease_, transactions), deadline)
+        )
+
+
+def refund_page(
+    lease_: lease.Lease, transactions: list[firestore.DocumentSnapshot], deadline: float = math.inf
+) -> Optional[firestore.DocumentSnapshot]:
+    def refund_claimed(transaction: firestore.DocumentSnapshot) -> None:
+        if not lease.confirm(lease_, [transaction]):
+            raise lease.ClaimLost(f"Transaction {transaction.id} is no longer claimed by this run.")
+        refund(transaction)
+
+    transactions = [transaction for transaction in transactions if is_refundable_now(transaction)]
+    errors = workers.run_by_provider(refund_claimed, transactions, get_payment_provider, REFUND_LIMITS, deadline)
+    refunded, failed, left = [], [], None
+    for transaction, error in zip(transactions, errors):
+        if isinstance(error, workers.DeadlineExceeded):
+            left = left or transaction
+        elif error is None:
+            logger.log(f"Successfully initiated refund for transaction {transaction.id}.")
+            if get_payment_provider(transaction) == "paypal":
+                refunded.append(transaction)
+        elif isinstance(error, (breaker.CircuitOpenError, lease.ClaimLost)):
+            logger.warn(f"Postponed refund for transaction {transaction.id}.")
+        else:
+            failed.append(transaction)
+    lease.update(lease_, refunded, update_data={"status": "payment_refunded"})
+    failed_ids = lease.update(lease_, failed, update_data={"status": "refund_failed"})
+    if failed_ids:
+        ops.record_event("Refund Failed", {"Transaction IDs": failed_ids}, failure=True)
+    return left
+
+
+def is_refundable_now(transaction: firestore.DocumentSnapshot) -> bool:
+    provider = get_payment_provider(transaction)
+    if breaker.is_open(provider):
+        logger.warn(f"Postponed refund for transaction {transaction.id} while {provider} is unavailable.")
+        return False
+    return True
+
+
+def refund(transaction: firestore.DocumentSnapshot) -> None:
+    if get_payment_provider(transaction) == "stripe":
+        providers.call(
+            "stripe.refund", lambda: refund_payment_intent(transaction.id, transaction.get("paymentIntentId"))
+        )
+    else:
+        paypal.refund(transaction.id, transaction.get("captureId"))
 
 
-def try_refund(transaction_id: str) -> None:
+def refund_payment_intent(transaction_id: str, payment_intent_id: str) -> None:
+    stripe = clients.get("stripe")
     try:
-        refund(transaction_id)
-        logger.log(f"Successfully initiated refund for transaction {transaction_id}.")
-    except Exception as e:
-        logger.error(utils.error_to_str(e))
-        utils.update_transaction(transaction_id, update_data={"status": "refund_failed"})
-        utils.enqueue_email(config.OPS_EMAIL, "Refund Failed", f"Transaction ID: {transaction_id}", block=True)
+        stripe.Refund.create(
+            payment_intent=payment_intent_id, idempotency_key=providers.idempotency_key("refund", transaction_id)
+        )
+    except stripe.InvalidRequestError as e:
+        if e.code != "charge_already_refunded":
+            raise
 
 
-def refund(transaction_id: str) -> None:
-    db = firestore.client()
-    transaction_ref = db.collection("transactions").document(transaction_id)
-    transaction = transaction_ref.get().to_dict()
-    if transaction["paymentProvider"] == "stripe":
-        payment_intent_id = transaction["paymentIntentId"]
-        stripe.Refund.create(payment_intent=payment_intent_id)
-    else:
-        capture_id = transaction["captureId"]
-        paypal.refund(transaction_id, capture_id)
+def get_payment_provider(transaction: firestore.DocumentSnapshot) -> str:
+    return "stripe" if transaction.get("paymentProvider") == "stripe" else "paypal"
 
 
 def create_transaction(spot_id: str, buyer_id: str, payment_provider: str) -> tuple[Any, dict]:
     db = firestore.client()
-    spot_doc = db.collection("spots").document(spot_id).get().to_dict()
-    transaction = {
+    spot_doc = cache.get("spots", spot_id).to_dict()
+    transaction = new_transaction(spot_id, spot_doc, buyer_id, payment_provider)
+    _, transaction_ref = db.collection("transactions").add(transaction)
+    return transaction_ref, transaction
+
+
+def new_transaction(spot_id: str, spot_doc: dict, buyer_id: str, payment_provider: str) -> dict:
+    return {
         "status": "pending",
         "spotId": spot_id,
         "queueName": spot_doc["queueName"],
@@ -151,86 +310,88 @@ def create_transaction(spot_id: str, buyer_id: str, payment_provider: str) -> tu
         "paymentProvider": payment_provider,
         "createdAt": firestore.SERVER_TIMESTAMP,  # type: ignore
     }
-    _, transaction_ref = db.collection("transactions").add(transaction)
-    return transaction_ref, transaction
-
 
-def stripe_book_spot(spot_id: str, transaction_id: str) -> None:
-    ensure_spot_is_reserved(spot_id, transaction_id, initiate_refund=True)
-    assert_consistent_price(spot_id, transaction_id, initiate_refund=True)
-    update_as_success(spot_id, transaction_id)
 
-
-def paypal_book_spot(spot_id: str, transaction_id: str, order_id: str) -> None:
-    ensure_spot_is_reserved(spot_id, transaction_id, initiate_refund=False)
-    assert_consistent_price(spot_id, transaction_id, initiate_refund=False)
-    paypal.capture_order(transaction_id, order_id)
-    update_as_success(spot_id, transaction_id)
-
-
-def ensure_spot_is_reserved(spot_id: str, transaction_id: str, initiate_refund: bool) -> None:
-    try:
-        reserve_spot(spot_id)
-    except utils.UpdateError as e:
-        db = firestore.client()
-        spot_ref = db.collection("spots").document(spot_id)
-        spot_status = spot_ref.get().get("status")
-        if spot_status != "reserved":
-            if initiate_refund:
-                utils.update_transaction(
-                    transaction_id, update_data={"status": "to_refund", "bookedAt": utils.timestamp()}
-                )
-            raise https_fn.HttpsError(
-                message="ff_error/spot_unavailable", code=https_fn.FunctionsErrorCode.ABORTED
-            ) from e
+def stage_booking(
+    transaction_: Any,
+    spot: firestore.DocumentSnapshot,
+    transaction_doc: firestore.DocumentSnapshot,
+    sell: bool,
+    initiate_refund: bool,
+) -> tuple[dict, dict, Optional[str]]:
+    spot_update, transaction_update, error = get_booking_updates(spot, transaction_doc, sell, initiate_refund)
+    if spot_update:
+        transaction_.update(spot.reference, spot_update)
+    if transaction_update:
+        transaction_.update(transaction_doc.reference, transaction_update)
+    return spot_update, transaction_update, error
+
+
+def record_booking(
+    spot: firestore.DocumentSnapshot,
+    transaction_doc: firestore.DocumentSnapshot,
+    spot_update: dict,
+    transaction_update: dict,
+) -> None:
+    cache.put("spots", spot.id, spot)
+    cache.apply_update("spots", spot.id, spot_update)
+    cache.put("transactions", transaction_doc.id, transaction_doc)
+    cache.apply_update("transactions", transaction_doc.id, transaction_update)
+    if spot_update.get("status") == "available":
+        logger.log(f"Spot {spot.id} has been freed.")
+
+
+def get_booking_updates(
+    spot: firestore.DocumentSnapshot, transaction: firestore.DocumentSnapshot, sell: bool, initiate_refund: bool
+) -> tuple[dict, dict, Optional[str]]:
+    refund_update = {"status": "to_refund", "bookedAt": utils.timestamp()} if initiate_refund else {}
+    spot_status = spot.get("status")
+    if spot_status not in ("available", "reserved"):
+        return {}, refund_update, "spot_unavailable"
+    if spot.get("buyerPrice") != transaction.get("buyerPrice"):
+        spot_update = {"status": "available"} if spot_status == "reserved" else {}
+        return spot_update, refund_update, "invalid_spot_price"
+    if sell:
+        transaction_update = {
+            "status": "charged_buyer",
+            "payout_status": "payout_pending",
+            "bookedAt": utils.timestamp(),
+        }
+        return {"status": "sold"}, transaction_update, None
+    if spot_status == "available":
+        return {"status": "reserved", "reservedAt": utils.timestamp()}, {}, None
+    return {}, {}, None
 
 
 def reserve_spot(spot_id: str) -> None:
-    utils.update_spot(spot_id, utils.is_available, {"status": "reserved", "reservedAt": utils.timestamp()})
-
+    reserved_at = utils.timestamp()
+    utils.update_spot(spot_id, utils.is_available, {"status": "reserved", "reservedAt": reserved_at})
+    schedule_expiry(spot_id, reserved_at)
 
-def assert_consistent_price(spot_id: str, transaction_id: str, initiate_refund: bool) -> None:
-    if not is_price_consistent(spot_id, transaction_id):
-        if initiate_refund:
-            utils.update_transaction(transaction_id, update_data={"status": "to_refund", "bookedAt": utils.timestamp()})
-        free_spot(spot_id)
-        raise https_fn.HttpsError(message="ff_error/invalid_spot_price", code=https_fn.FunctionsErrorCode.ABORTED)
 
-
-def is_price_consistent(spot_id: str, transaction_id: str) -> bool:
-    db = firestore.client()
-    spot_ref = db.collection("spots").document(spot_id)
-    spot_buyer_price = spot_ref.get().get("buyerPrice")
-    transaction_ref = db.collection("transactions").document(transaction_id)
-    transaction_buyer_price = transaction_ref.get().get("buyerPrice")
-    return spot_buyer_price == transaction_buyer_price
+@utils.tame_errors
+def schedule_expiry(spot_id: str, reserved_at: int) -> None:
+    tasks.schedule(
+        "expire_reservation",
+        {"spotId": spot_id, "reservedAt": reserved_at},
+        run_at=reserved_at + RESERVATION_TTL * 60,
+        task_id=f"{spot_id}-{reserved_at}",
+    )
 
 
-def update_as_success(spot_id: str, transaction_id: str) -> None:
+@tasks.handler
+def expire_reservation(data: dict) -> None:
+    spot_id = data["spotId"]
+    reserved_at = data["reservedAt"]
     try:
-        utils.update_spot(spot_id, utils.is_reserved, {"status": "sold"})
-        utils.update_transaction(
-            transaction_id,
-            update_data={
-                "status": "charged_buyer",
-                "payout_status": "payout_pending",
-                "bookedAt": utils.timestamp(),
-            },
-        )
-        notify_stakeholders(spot_id, transaction_id)
-    except utils.UpdateError as e:
-        utils.update_transaction(transaction_id, update_data={"status": "to_refund", "bookedAt": utils.timestamp()})
-        raise https_fn.HttpsError(
-            message="ff_error/spot_unavailable/charged", code=https_fn.FunctionsErrorCode.ABORTED
-        ) from e
+        utils.update_spot(spot_id, lambda spot: is_reserved_at(spot, reserved_at), {"status": "available"})
+    except utils.UpdateError:
+        return  # the spot has been sold, freed or reserved again
+    logger.log(f"Spot {spot_id} has been freed.")
 
 
-@utils.tame_errors
-def notify_stakeholders(spot_id: str, transaction_id: str) -> None:
-    seller_notification_future, seller_email_future = notify_seller_of_sale(spot_id)
-    buyer_email_future = notify_buyer_of_sale(transaction_id)
-    ops_email_future = notify_operators_of_sale(spot_id, transaction_id)
-    utils.resolve_futures(seller_notification_future, seller_email_future, buyer_email_future, ops_email_future)
+def is_reserved_at(spot: firestore.DocumentSnapshot, reserved_at: int) -> bool:
+    return utils.is_reserved(spot) and spot.get("reservedAt") == reserved_at
 
 
 def notify_seller_of_sale(spot_id: str) -> tuple[future.Future, future.Future]:
@@ -242,35 +403,25 @@ def notify_seller_of_sale(spot_id: str) -> tuple[future.Future, future.Future]:
         data={"type": "sold_spot"},
         block=False,
     )
-    email_future = utils.enqueue_email(seller_id, "Spot Sold", utils.get_email("spot_sold"), block=False)
+    email_future = utils.enqueue_template_email(seller_id, "Spot Sold", "spot_sold", block=False)
     return notification_future, email_future
 
 
 def notify_buyer_of_sale(transaction_id: str) -> future.Future:
-    db = firestore.client()
-    transaction_ref = db.collection("transactions").document(transaction_id)
-    buyer_id = transaction_ref.get().get("buyerId")
-    return utils.enqueue_email(buyer_id, "Spot Booked", utils.get_email("spot_booked"), block=False)
-
-
-def notify_operators_of_sale(spot_id: str, transaction_id: str) -> future.Future:
-    return utils.enqueue_email(
-        config.OPS_EMAIL,
-        "Spot Sold",
-        textwrap.dedent(
-            f"""\
-            Spot ID: {spot_id}
-            Transaction ID: {transaction_id}
-            """
-        ),
-        block=False,
-    )
+    buyer_id = cache.get("transactions", transaction_id).get("buyerId")
+    return utils.enqueue_template_email(buyer_id, "Spot Booked", "spot_booked", block=False)
+
+
+def notify_operators_of_sale(spot_id: str, transaction_id: str) -> None:
+    ops.record_event("Spot Sold", get_sale_ids(spot_id, transaction_id))
+
+
+def get_sale_ids(spot_id: str, transaction_id: str) -> dict[str, list[str]]:
+    return {"Spot IDs": [spot_id], "Transaction IDs": [transaction_id]}
 
 
 def get_seller_id(spot_id: str) -> str:
-    db = firestore.client()
-    spot_ref = db.collection("spots").document(spot_id)
-    seller_id = spot_ref.get().get("sellerId")
+    seller_id = cache.get("spots", spot_id).get("sellerId")
     return seller_id
 
 
@@ -278,16 +429,14 @@ def delete_user(user_id: str) -> None:
     if has_open_spots(user_id):
         raise https_fn.HttpsError(message="ff_error/user_has_active_offer", code=https_fn.FunctionsErrorCode.ABORTED)
     firebase_admin.auth.update_user(user_id, disabled=True)  # type: ignore
-    utils.enqueue_email(user_id, "Account Deleted", utils.get_email("account_deleted"), block=True)
+    utils.enqueue_template_email(user_id, "Account Deleted", "account_deleted", block=True)
 
 
 def has_open_spots(user_id: str) -> bool:
     db = firestore.client()
     spots_ref = db.collection("spots")
     query = spots_ref.where("sellerId", "==", user_id).where("status", "in", ["available", "reserved"])
-    spots = query.stream()
-    n_spots = sum(1 for _ in spots)
-    return n_spots > 0
+    return utils.exists(query)
 
 
 def report_issue(spot_id: str, reporter_id: str) -> None:
@@ -307,14 +456,12 @@ def report_issue(spot_id: str, reporter_id: str) -> None:
         data={"type": "spot_deleted_due_to_issue"},
         block=False,
     )
-    email_future = utils.enqueue_email(seller_id, "Spot Deleted", utils.get_email("spot_deleted"), block=False)
+    email_future = utils.enqueue_template_email(seller_id, "Spot Deleted", "spot_deleted", block=False)
     utils.resolve_futures(notification_future, email_future)
 
 
 def n_issue_reporters(spot_id: str) -> int:
-    db = firestore.client()
-    spot_ref = db.collection("spots").document(spot_id)
-    issue_reporter_ids = spot_ref.get().get("issueReporterIds")
+    issue_reporter_ids = cache.get("spots", spot_id).get("issueReporterIds")
     return len(issue_reporter_ids)
 
 
@@ -0,0 +1,45 @@
+import json
+import time
+from typing import Any
+from urllib.parse import urlparse
+
+from taqo import clients, config, metrics
+
+
+def post(url: str, **kwargs) -> Any:
+    return request("post", url, **kwargs)
+
+
+def get(url: str, **kwargs) -> Any:
+    return request("get", url, **kwargs)
+
+
+def request(method: str, url: str, **kwargs) -> Any:
+    kwargs.setdefault("timeout", config.TIMEOUT)
+    start = time.perf_counter()
+    response = getattr(clients.get("http_session"), method)(url, **kwargs)
+    n_bytes = get_payload_size(kwargs.get("data", kwargs.get("json"))) + get_payload_size(response.content)
+    metrics.record(f"http.{method}:{urlparse(url).netloc}", time.perf_counter() - start, n_bytes=n_bytes)
+    return response
+
+
+async def post_async(url: str, **kwargs) -> Any:
+    kwargs.setdefault("timeout", config.TIMEOUT)
+    start = time.perf_counter()
+    response = await clients.get("async_http_client").post(url, **kwargs)
+    n_bytes = get_payload_size(kwargs.get("data", kwargs.get("json"))) + get_payload_size(response.content)
+    metrics.record(f"http.post:{urlparse(url).netloc}", time.perf_counter() - start, n_bytes=n_bytes)
+    return response
+
+
+def get_payload_size(payload: Any) -> int:
+    if payload is None:
+        return 0
+    if isinstance(payload, bytes):
+        return len(payload)
+    if isinstance(payload, str):
+        return len(payload.encode("utf-8"))
+    try:
+        return len(json.dumps(payload))
+    except TypeError:
+        return 0
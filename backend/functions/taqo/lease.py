@@ -0,0 +1,140 @@
+import contextlib
+import uuid
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from firebase_admin import firestore
+from firebase_functions import logger
+from google.cloud.firestore_v1.bulk_writer import BulkWriteFailure, BulkWriter
+from google.rpc import code_pb2  # type: ignore
+from taqo import utils
+
+
+class ClaimLost(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Lease:
+    name: str
+    holder: str
+    token: int
+    expires_at: int
+
+
+def acquire(name: str, ttl: int) -> Optional[Lease]:
+    db = firestore.client()
+    lease_ref = db.collection("leases").document(name)
+    holder = uuid.uuid4().hex
+
+    @firestore.transactional  # type: ignore
+    def acquire_in_transaction(transaction_):
+        lease_doc = lease_ref.get(transaction=transaction_)
+        now = utils.timestamp()
+        current = lease_doc.to_dict() if lease_doc.exists else {}
+        if current.get("expiresAt", 0) > now:
+            return None
+        lease_ = Lease(name, holder, current.get("token", 0) + 1, now + ttl)
+        transaction_.set(lease_ref, {"holder": holder, "token": lease_.token, "expiresAt": lease_.expires_at})
+        return lease_
+
+    return acquire_in_transaction(db.transaction())
+
+
+def release(lease_: Lease) -> None:
+    db = firestore.client()
+    lease_ref = db.collection("leases").document(lease_.name)
+
+    @firestore.transactional  # type: ignore
+    def release_in_transaction(transaction_):
+        lease_doc = lease_ref.get(transaction=transaction_)
+        if lease_doc.exists and lease_doc.get("token") == lease_.token:
+            transaction_.update(lease_ref, {"expiresAt": 0})
+
+    release_in_transaction(db.transaction())
+
+
+@contextlib.contextmanager
+def held(name: str, ttl: int) -> Iterator[Optional[Lease]]:
+    lease_ = acquire(name, ttl)
+    if lease_ is None:
+        logger.log(f"Lease {name} is held by another run, skipping.")
+        yield None
+        return
+    try:
+        yield lease_
+    finally:
+        release(lease_)
+
+
+def claim(lease_: Lease, documents: list[firestore.DocumentSnapshot]) -> list[firestore.DocumentSnapshot]:
+    db = firestore.client()
+    now = utils.timestamp()
+    claimed, lost = [], set()
+
+    def on_claim_error(error: BulkWriteFailure, _bulk_writer: BulkWriter) -> bool:
+        if error.code != code_pb2.FAILED_PRECONDITION and error.attempts < utils.MAX_WRITE_ATTEMPTS:
+            return True
+        lost.add(error.operation.reference.id)  # type: ignore
+        return False
+
+    bulk_writer = db.bulk_writer()
+    bulk_writer.on_write_error(on_claim_error)
+    for document in documents:
+        if not is_claimable(document, lease_, now):
+            continue
+        marker = {"lease": lease_.name, "token": lease_.token, "expiresAt": lease_.expires_at}
+        option = db.write_option(last_update_time=document.update_time)
+        bulk_writer.update(document.reference, {"claim": marker}, option=option)
+        claimed.append(document)
+    bulk_writer.close()
+    return [document for document in claimed if document.id not in lost]
+
+
+def is_claimable(document: firestore.DocumentSnapshot, lease_: Lease, now: int) -> bool:
+    marker = (document.to_dict() or {}).get("claim")
+    if marker is None or marker["expiresAt"] <= now:
+        return True
+    return marker["lease"] == lease_.name and marker["token"] < lease_.token
+
+
+def confirm(lease_: Lease, documents: list[firestore.DocumentSnapshot]) -> list[firestore.DocumentSnapshot]:
+    db = firestore.client()
+    now = utils.timestamp()
+    snapshots = db.get_all([document.reference for document in documents], field_paths=["claim"])
+    confirmed_ids = {snapshot.id for snapshot in snapshots if is_held(snapshot, lease_) and is_live(snapshot, now)}
+    return [document for document in documents if document.id in confirmed_ids]
+
+
+def update(lease_: Lease, documents: list[firestore.DocumentSnapshot], update_data: dict) -> list[str]:
+    updated_ids = []
+    for i in range(0, len(documents), utils.MAX_BATCH_WRITES):
+        refs = [document.reference for document in documents[i : i + utils.MAX_BATCH_WRITES]]
+        updated_ids += update_held(lease_, refs, update_data)
+    lost_ids = [document.id for document in documents if document.id not in updated_ids]
+    if lost_ids:
+        logger.warn(f"Documents {lost_ids} were claimed by another run of {lease_.name} and have not been updated.")
+    return updated_ids
+
+
+def update_held(lease_: Lease, refs: list[firestore.DocumentReference], update_data: dict) -> list[str]:
+    db = firestore.client()
+
+    @firestore.transactional  # type: ignore
+    def update_in_transaction(transaction_):
+        snapshots = db.get_all(refs, field_paths=["claim"], transaction=transaction_)
+        held_refs = [snapshot.reference for snapshot in snapshots if is_held(snapshot, lease_)]
+        for ref in held_refs:
+            transaction_.update(ref, update_data)
+        return [ref.id for ref in held_refs]
+
+    return update_in_transaction(db.transaction())
+
+
+def is_held(document: firestore.DocumentSnapshot, lease_: Lease) -> bool:
+    marker = (document.to_dict() or {}).get("claim")
+    return marker is not None and marker["lease"] == lease_.name and marker["token"] == lease_.token
+
+
+def is_live(document: firestore.DocumentSnapshot, now: int) -> bool:
+    return document.get("claim")["expiresAt"] > now
@@ -0,0 +1,378 @@
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Iterator, Optional
+
+from firebase_functions import logger
+from google.cloud.firestore_v1 import (
+    aggregation,
+    batch,
+    bulk_writer,
+    client,
+    document,
+    query,
+    transaction,
+)
+
+DOCUMENT_NAME_SIZE = 16
+COUNT_ENTRIES_PER_READ = 1000
+
+
+@dataclass
+class OperationStats:
+    calls: int = 0
+    documents: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class RequestMetrics:
+    endpoint: str
+    start: float = field(default_factory=time.perf_counter)
+    operations: dict[str, OperationStats] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+instrumented = threading.Event()
+
+current: contextvars.ContextVar[Optional[RequestMetrics]] = contextvars.ContextVar("current", default=None)
+in_document_write: contextvars.ContextVar[bool] = contextvars.ContextVar("in_document_write", default=False)
+
+
+@contextlib.contextmanager
+def request_scope(endpoint: str) -> Iterator[RequestMetrics]:
+    metrics = RequestMetrics(endpoint)
+    token = current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        current.reset(token)
+        logger.log(summarize(metrics), ff_type="metrics")
+
+
+def measured(f: Callable) -> Callable:
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        with request_scope(f.__name__):
+            return f(*args, **kwargs)
+
+    return wrapper
+
+
+def record(operation: str, seconds: float, documents: int = 0, n_bytes: int = 0) -> None:
+    metrics = current.get()
+    if metrics is None:
+        return
+    with metrics.lock:
+        stats = metrics.operations.setdefault(operation, OperationStats())
+        stats.calls += 1
+        stats.documents += documents
+        stats.bytes += n_bytes
+        stats.seconds += seconds
+
+
+def summarize(metrics: RequestMetrics) -> dict:
+    totals = {"firestore_reads": 0, "firestore_writes": 0, "firestore_transactions": 0, "bytes": 0}
+    for operation, stats in metrics.operations.items():
+        kind = operation.split(":")[0]
+        if kind in ("firestore.get", "firestore.query", "firestore.get_all", "firestore.aggregation"):
+            totals["firestore_reads"] += stats.documents
+        elif kind in ("firestore.write", "firestore.batch", "firestore.transaction", "firestore.bulk_writer"):
+            totals["firestore_writes"] += stats.documents
+        if kind == "firestore.transaction":
+            totals["firestore_transactions"] += stats.calls
+        totals["bytes"] += stats.bytes
+    return {
+        "endpoint": metrics.endpoint,
+        "seconds": time.perf_counter() - metrics.start,
+        **totals,
+        "operations": {operation: asdict(stats) for operation, stats in sorted(metrics.operations.items())},
+    }
+
+
+def propagate(f: Callable) -> Callable:
+    metrics = current.get()
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        token = current.set(metrics)
+        try:
+            return f(*args, **kwargs)
+        finally:
+            current.reset(token)
+
+    return wrapper
+
+
+def get_size(value: Any) -> int:
+    if isinstance(value, dict):
+        return sum(len(key) + 1 + get_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(get_size(item) for item in value)
+    if isinstance(value, str):
+        return len(value) + 1
+    if isinstance(value, bytes):
+        return len(value)
+    if value is None or isinstance(value, bool):
+        return 1
+    return 8
+
+
+@functools.cache
+def instrument() -> None:
+    instrumented.set()
+    patch(document.DocumentReference, "get", wrap_get)
+    for method in ("create", "set", "update", "delete"):
+        patch(document.DocumentReference, method, wrap_write)
+        patch(bulk_writer.BulkWriter, method, wrap_bulk_write)
+    patch(query.Query, "stream", wrap_stream)
+    patch(client.Client, "get_all", wrap_get_all)
+    patch(aggregation.AggregationQuery, "get", wrap_aggregation)
+    patch(batch.WriteBatch, "commit", functools.partial(wrap_commit, "firestore.batch"))
+    patch(transaction.Transaction, "_commit", functools.partial(wrap_commit, "firestore.transaction"))
+    patch(bulk_writer.BulkWriter, "flush", wrap_flush)
+
+
+@functools.cache
+def instrument_async() -> None:
+    from google.cloud.firestore_v1 import (  # pylint: disable=import-outside-toplevel
+        async_batch,
+        async_document,
+        async_transaction,
+    )
+
+    patch(async_document.AsyncDocumentReference, "get", wrap_async_get)
+    for method in ("create", "set", "update", "delete"):
+        patch(async_document.AsyncDocumentReference, method, wrap_async_write)
+    patch(async_batch.AsyncWriteBatch, "commit", functools.partial(wrap_async_commit, "firestore.batch"))
+    patch(async_transaction.AsyncTransaction, "_commit", functools.partial(wrap_async_commit, "firestore.transaction"))
+
+
+def patch(cls: type, method: str, wrap: Callable[[Callable], Callable]) -> None:
+    original = getattr(cls, method, None)
+    if original is None:
+        logger.warn(f"Cannot instrument {cls.__name__}.{method}, it does not exist in this Firestore version.")
+        return
+    setattr(cls, method, wrap(original))
+
+
+def record_safely(seconds: float, measure: Callable[[], tuple[str, int, int]]) -> None:
+    try:
+        operation, documents, n_bytes = measure()
+        record(operation, seconds, documents, n_bytes)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logger.warn(f"Failed to record Firestore metrics: {e!r}")
+
+
+def get_collection_id(value: Any, *path: str) -> str:
+    for name in path:
+        value = getattr(value, name, None)
+    return getattr(value, "id", None) or "unknown"
+
+
+def get_snapshot_size(snapshot: Any) -> int:
+    if not getattr(snapshot, "exists", False):
+        return 0
+    return DOCUMENT_NAME_SIZE + get_size(getattr(snapshot, "_data", None))
+
+
+def get_write_size(args: tuple) -> int:
+    return DOCUMENT_NAME_SIZE + get_size(args[0] if args and isinstance(args[0], dict) else None)
+
+
+def count_writes(batch_: Any) -> int:
+    try:
+        return len(getattr(batch_, "_write_pbs", None) or ())
+    except TypeError:
+        return 0
+
+
+def count_entries(result: Any) -> int:
+    return int(result[0][0].value) if result and result[0] else 0
+
+
+def wrap_get(get: Callable) -> Callable:
+    @functools.wraps(get)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        snapshot = get(self, *args, **kwargs)
+        record_safely(
+            time.perf_counter() - start,
+            lambda: (f"firestore.get:{get_collection_id(self, 'parent')}", 1, get_snapshot_size(snapshot)),
+        )
+        return snapshot
+
+    return wrapper
+
+
+def wrap_write(write: Callable) -> Callable:
+    @functools.wraps(write)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        token = in_document_write.set(True)
+        try:
+            result = write(self, *args, **kwargs)
+        finally:
+            in_document_write.reset(token)
+        record_safely(
+            time.perf_counter() - start,
+            lambda: (f"firestore.write:{get_collection_id(self, 'parent')}", 1, get_write_size(args)),
+        )
+        return result
+
+    return wrapper
+
+
+def wrap_stream(stream: Callable) -> Callable:
+    @functools.wraps(stream)
+    def wrapper(self, *args, **kwargs):
+        seconds, snapshots = 0.0, []
+        iterator = iter(stream(self, *args, **kwargs))
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    snapshot = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += time.perf_counter() - start
+                snapshots.append(snapshot)
+                yield snapshot
+        finally:
+            record_safely(
+                seconds,
+                lambda: (
+                    f"firestore.query:{get_collection_id(self, '_parent')}",
+                    max(1, len(snapshots)),
+                    sum(get_snapshot_size(snapshot) for snapshot in snapshots),
+                ),
+            )
+
+    return wrapper
+
+
+def wrap_get_all(get_all: Callable) -> Callable:
+    @functools.wraps(get_all)
+    def wrapper(self, references, *args, **kwargs):
+        references = list(references)
+        start = time.perf_counter()
+        snapshots = list(get_all(self, references, *args, **kwargs))
+        record_safely(
+            time.perf_counter() - start,
+            lambda: (
+                f"firestore.get_all:{get_collection_id(references[0], 'parent') if references else ''}",
+                len(references),
+                sum(get_snapshot_size(snapshot) for snapshot in snapshots),
+            ),
+        )
+        return iter(snapshots)
+
+    return wrapper
+
+
+def wrap_aggregation(get: Callable) -> Callable:
+    @functools.wraps(get)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = get(self, *args, **kwargs)
+        record_safely(
+            time.perf_counter() - start,
+            lambda: (
+                f"firestore.aggregation:{get_collection_id(self, '_nested_query', '_parent')}",
+                max(1, -(-count_entries(result) // COUNT_ENTRIES_PER_READ)),
+                0,
+            ),
+        )
+        return result
+
+    return wrapper
+
+
+def wrap_commit(operation: str, commit: Callable) -> Callable:
+    @functools.wraps(commit)
+    def wrapper(self, *args, **kwargs):
+        if in_document_write.get():
+            return commit(self, *args, **kwargs)
+        documents = count_writes(self)
+        start = time.perf_counter()
+        result = commit(self, *args, **kwargs)
+        record_safely(time.perf_counter() - start, lambda: (operation, documents, 0))
+        return result
+
+    return wrapper
+
+
+def wrap_bulk_write(write: Callable) -> Callable:
+    @functools.wraps(write)
+    def wrapper(self, reference, *args, **kwargs):
+        start = time.perf_counter()
+        result = write(self, reference, *args, **kwargs)
+        record_safely(
+            time.perf_counter() - start,
+            lambda: (f"firestore.bulk_writer:{get_collection_id(reference, 'parent')}", 1, get_write_size(args)),
+        )
+        return result
+
+    return wrapper
+
+
+def wrap_flush(flush: Callable) -> Callable:
+    @functools.wraps(flush)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = flush(self, *args, **kwargs)
+        record_safely(time.perf_counter() - start, lambda: ("firestore.bulk_writer.flush", 0, 0))
+        return result
+
+    return wrapper
+
+
+def wrap_async_get(get: Callable) -> Callable:
+    @functools.wraps(get)
+    async def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        snapshot = await get(self, *args, **kwargs)
+        record_safely(
+            time.perf_counter() - start,
+            lambda: (f"firestore.get:{get_collection_id(self, 'parent')}", 1, get_snapshot_size(snapshot)),
+        )
+        return snapshot
+
+    return wrapper
+
+
+def wrap_async_write(write: Callable) -> Callable:
+    @functools.wraps(write)
+    async def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        token = in_document_write.set(True)
+        try:
+            result = await write(self, *args, **kwargs)
+        finally:
+            in_document_write.reset(token)
+        record_safely(
+            time.perf_counter() - start,
+            lambda: (f"firestore.write:{get_collection_id(self, 'parent')}", 1, get_write_size(args)),
+        )
+        return result
+
+    return wrapper
+
+
+def wrap_async_commit(operation: str, commit: Callable) -> Callable:
+    @functools.wraps(commit)
+    async def wrapper(self, *args, **kwargs):
+        if in_document_write.get():
+            return await commit(self, *args, **kwargs)
+        documents = count_writes(self)
+        start = time.perf_counter()
+        result = await commit(self, *args, **kwargs)
+        record_safely(time.perf_counter() - start, lambda: (operation, documents, 0))
+        return result
+
+    return wrapper
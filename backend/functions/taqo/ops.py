@@ -0,0 +1,57 @@
+from firebase_admin import firestore
+from firebase_functions import logger
+from taqo import config, utils
+
+DIGEST_SUBJECT = "Ops Digest"
+DIGEST_PAGE_SIZE = 500
+
+
+def record_event(subject: str, ids: dict[str, list[str]], failure: bool = False) -> None:
+    db = firestore.client()
+    events_ref = db.collection("ops_events")
+    events_ref.add({"subject": subject, "ids": ids, "failure": failure, "createdAt": utils.timestamp()})
+    if not failure:
+        return
+    n_failures = utils.count(events_ref.where("failure", "==", True))
+    if n_failures == config.OPS_ALERT_THRESHOLD:
+        utils.enqueue_email(config.OPS_EMAIL, subject, format_ids(ids), block=True)
+
+
+def send_digest() -> None:
+    db = firestore.client()
+    events = get_events()
+    if not events:
+        return
+    utils.enqueue_email(config.OPS_EMAIL, DIGEST_SUBJECT, format_digest(events), block=True)
+    bulk_writer = db.bulk_writer()
+    for event in events:
+        bulk_writer.delete(event.reference, option=db.write_option(last_update_time=event.update_time))
+    bulk_writer.close()
+    logger.log(f"Sent ops digest with {len(events)} events.")
+
+
+def get_events() -> list[firestore.DocumentSnapshot]:
+    query = firestore.client().collection("ops_events").order_by("createdAt").limit(DIGEST_PAGE_SIZE)
+    events: list[firestore.DocumentSnapshot] = []
+    while True:
+        page = list((query.start_after(events[-1]) if events else query).stream())
+        events += page
+        if len(page) < DIGEST_PAGE_SIZE:
+            return events
+
+
+def format_digest(events: list[firestore.DocumentSnapshot]) -> str:
+    subjects: dict[str, dict[str, list[str]]] = {}
+    counts: dict[str, int] = {}
+    for event in events:
+        subject = event.get("subject")
+        counts[subject] = counts.get(subject, 0) + 1
+        ids = subjects.setdefault(subject, {})
+        for label, values in event.get("ids").items():
+            ids.setdefault(label, []).extend(values)
+    sections = [f"{subject}: {counts[subject]}\n\n{format_ids(ids)}" for subject, ids in subjects.items()]
+    return "\n\n".join(sections)
+
+
+def format_ids(ids: dict[str, list[str]]) -> str:
+    return "\n".join(f"{label}: {', '.join(values)}" for label, values in ids.items())
@@ -1,10 +1,25 @@
+import hashlib
 import json
+import threading
 import time
+from typing import Any, Optional
 
-import requests
 from firebase_admin import firestore
 from firebase_functions import https_fn
-from taqo import config, utils
+from taqo import cache, config, http_client, ops, providers, utils
+
+MAX_PAYOUT_ITEMS = 15000
+PAYOUT_ITEM_FAILURE_EVENTS = {
+    "PAYMENT.PAYOUTS-ITEM.BLOCKED",
+    "PAYMENT.PAYOUTS-ITEM.CANCELED",
+    "PAYMENT.PAYOUTS-ITEM.DENIED",
+    "PAYMENT.PAYOUTS-ITEM.FAILED",
+    "PAYMENT.PAYOUTS-ITEM.REFUNDED",
+    "PAYMENT.PAYOUTS-ITEM.RETURNED",
+}
+
+token_cache: dict[str, Any] = {"token": None, "expiration": 0.0}
+token_lock = threading.Lock()
 
 
 def create_order(transaction_id: str) -> dict:
@@ -14,100 +29,143 @@ def create_order(transaction_id: str) -> dict:
         "intent": "CAPTURE",
         "purchase_units": [{"amount": {"currency_code": "EUR", "value": str(buyer_price)}}],
     }
-    response = requests.post(
+    response = http_client.post(
         config.PAYPAL_ORDERS_URL,
         headers=headers,
         data=json.dumps(data),
-        timeout=config.TIMEOUT,
     ).json()
     assert "id" in response
     return response
 
 
 def get_buyer_price(transaction_id: str) -> float:
-    db = firestore.client()
-    transaction_ref = db.collection("transactions").document(transaction_id)
-    buyer_price = transaction_ref.get().get("buyerPrice")
+    buyer_price = cache.get("transactions", transaction_id).get("buyerPrice")
     assert buyer_price
     return buyer_price
 
 
-def capture_order(transaction_id: str, order_id: str) -> None:
-    headers = get_headers()
-    url = f"{config.PAYPAL_ORDERS_URL}/{order_id}/capture"
-    response = requests.post(url, headers=headers, timeout=config.TIMEOUT).json()
+def get_capture_update(response: dict) -> dict:
     if "details" in response:
-        utils.update_transaction(transaction_id, update_data={"status": "payment_failed"})
-        raise https_fn.HttpsError(message="ff_error/payment_failed", code=https_fn.FunctionsErrorCode.ABORTED)
-    transaction = response["purchase_units"][0]["payments"]["captures"][0]
-    assert transaction["status"] == "COMPLETED"
-    utils.update_transaction(transaction_id, update_data={"captureId": transaction["id"]})
+        return {"status": "payment_failed"}
+    capture = response["purchase_units"][0]["payments"]["captures"][0]
+    assert capture["status"] == "COMPLETED"
+    return {"captureId": capture["id"]}
 
 
 def refund(transaction_id: str, capture_id: str) -> None:
-    headers = get_headers()
+    providers.call("paypal.refund", lambda: post_refund(transaction_id, capture_id))
+
+
+def post_refund(transaction_id: str, capture_id: str) -> None:
+    headers = get_headers(providers.idempotency_key("refund", transaction_id))
     url = f"{config.PAYPAL_CAPTURES_URL}/{capture_id}/refund"
-    response = requests.post(url, headers=headers, data="{}", timeout=config.TIMEOUT)
-    assert response.status_code == 201
+    response = providers.check_response(http_client.post(url, headers=headers, data="{}"))
+    if response.status_code == 422 and get_issue(response.json()) == "CAPTURE_FULLY_REFUNDED":
+        return
+    assert response.status_code in (200, 201)
     assert response.json()["status"] == "COMPLETED"
-    utils.update_transaction(transaction_id, update_data={"status": "payment_refunded"})
 
 
-def payout(transaction_id: str) -> str:
-    seller_paypal_email, seller_price = get_seller_data(transaction_id)
-    payout_batch_id = send_money(seller_paypal_email, seller_price, transaction_id)
+def get_issue(response: dict) -> Optional[str]:
+    details = response.get("details") or [{}]
+    return details[0].get("issue")
+
+
+def batch_payout(transactions: list[firestore.DocumentSnapshot], receivers: dict[str, str]) -> str:
+    assert 0 < len(transactions) <= MAX_PAYOUT_ITEMS
+    transaction_ids = [transaction.id for transaction in transactions]
+    items = [
+        {
+            "amount": {"value": str(transaction.get("sellerPrice")), "currency": "EUR"},
+            "receiver": receivers[transaction.id],
+            "sender_item_id": transaction.id,
+        }
+        for transaction in transactions
+    ]
+    sender_batch_id = get_sender_batch_id(transaction_ids)
+    batch_ref = firestore.client().collection("payout_batches").document(sender_batch_id)
+    batch_ref.set({"transactionIds": transaction_ids, "createdAt": utils.timestamp()})
+    payout_batch_id = send_batch(sender_batch_id, items)
+    batch_ref.update({"payoutBatchId": payout_batch_id})
     return payout_batch_id
 
 
-def get_seller_data(transaction_id: str) -> tuple[str, int]:
-    db = firestore.client()
-    transaction_ref = db.collection("transactions").document(transaction_id)
-    transaction = transaction_ref.get().to_dict()
-    seller_price = transaction["sellerPrice"]
-    seller_id = transaction["sellerId"]
-    seller_paypal_email = db.collection("users").document(seller_id).get().get("paypalEmail")
-    return seller_paypal_email, seller_price
+def get_receivers(transactions: list[firestore.DocumentSnapshot]) -> dict[str, str]:
+    seller_paypal_emails = get_paypal_emails({transaction.get("sellerId") for transaction in transactions})
+    return {
+        transaction.id: seller_paypal_emails[transaction.get("sellerId")]
+        for transaction in transactions
+        if transaction.get("sellerId") in seller_paypal_emails
+    }
 
 
-def send_money(seller_paypal_email: str, seller_price: int, transaction_id: str) -> str:
-    headers = get_headers()
+def get_paypal_emails(user_ids: set[str]) -> dict[str, str]:
+    users = utils.get_documents("users", list(user_ids), field_paths=["paypalEmail"])
+    paypal_emails = {user_id: (user.to_dict() or {}).get("paypalEmail") for user_id, user in users.items()}
+    return {user_id: paypal_email for user_id, paypal_email in paypal_emails.items() if paypal_email}
+
 
+def get_sender_batch_id(transaction_ids: list[str]) -> str:
+    return hashlib.sha256(",".join(sorted(transaction_ids)).encode("utf-8")).hexdigest()
+
+
+def send_batch(sender_batch_id: str, items: list[dict]) -> str:
+    headers = get_headers(providers.idempotency_key("payout", sender_batch_id))
     data = {
         "sender_batch_header": {
-            "sender_batch_id": transaction_id,
+            "sender_batch_id": sender_batch_id,
             "email_subject": "Your Taqo payout",
             "recipient_type": "EMAIL",
         },
-        "items": [
-            {
-                "amount": {"value": str(seller_price), "currency": "EUR"},
-                "receiver": seller_paypal_email,
-            }
-        ],
+        "items": items,
     }
+    response = post_payout(headers, data)
+    return response.json()["batch_header"]["payout_batch_id"]
 
-    response = requests.post(
-        config.PAYPAL_PAYOUTS_URL,
-        headers=headers,
-        data=json.dumps(data),
-        timeout=config.TIMEOUT,
-    )
-    assert response.status_code == 201
-    payout_batch_id = response.json()["batch_header"]["payout_batch_id"]
-    return payout_batch_id
+
+def post_payout(headers: dict[str, str], data: dict) -> Any:
+    def post() -> Any:
+        return providers.check_response(
+            http_client.post(config.PAYPAL_PAYOUTS_URL, headers=headers, data=json.dumps(data))
+        )
+
+    response = providers.call("paypal.payout", post)
+    assert response.status_code in (200, 201)
+    return response
 
 
 def handle_webhook(event: dict) -> https_fn.Response:
     event_type = event["event_type"]
-    transaction_id = event["resource"]["batch_header"]["sender_batch_header"]["sender_batch_id"]
+    if event_type.startswith("PAYMENT.PAYOUTS-ITEM."):
+        transaction_id = event["resource"]["payout_item"].get("sender_item_id")
+        if transaction_id:
+            handle_payout_item_event(event_type, transaction_id)
+        return https_fn.Response("OK")
+    sender_batch_id = event["resource"]["batch_header"]["sender_batch_header"]["sender_batch_id"]
+    batch = firestore.client().collection("payout_batches").document(sender_batch_id).get()
+    if batch.exists:
+        if event_type == "PAYMENT.PAYOUTSBATCH.DENIED":
+            transaction_ids = batch.get("transactionIds")
+            utils.update_transactions(transaction_ids, update_data={"payout_status": "payout_failed"})
+            ops.record_event("Payout Failed", {"Transaction IDs": transaction_ids}, failure=True)
+        return https_fn.Response("OK")
+    transaction_id = sender_batch_id
     if event_type == "PAYMENT.PAYOUTSBATCH.SUCCESS":
         utils.update_transaction(transaction_id, update_data={"payout_status": "payout_succeeded"})
     elif event_type == "PAYMENT.PAYOUTSBATCH.DENIED":
         utils.update_transaction(transaction_id, update_data={"payout_status": "payout_failed"})
-        utils.enqueue_email(config.OPS_EMAIL, "Payout Failed", f"Transaction ID: {transaction_id}", block=True)
+        ops.record_event("Payout Failed", {"Transaction IDs": [transaction_id]}, failure=True)
     return https_fn.Response("OK")
 
 
+def handle_payout_item_event(event_type: str, transaction_id: str) -> None:
+    if event_type == "PAYMENT.PAYOUTS-ITEM.SUCCEEDED":
+        utils.update_transaction(transaction_id, update_data={"payout_status": "payout_succeeded"})
+    elif event_type in PAYOUT_ITEM_FAILURE_EVENTS:
+        utils.update_transaction(transaction_id, update_data={"payout_status": "payout_failed"})
+        ops.record_event("Payout Failed", {"Transaction IDs": [transaction_id]}, failure=True)
+
+
 def verify_webhook_signature(req: https_fn.Request) -> None:
     headers = get_headers()
     data = {
@@ -119,42 +177,53 @@ def verify_webhook_signature(req: https_fn.Request) -> None:
         "webhook_id": config.PAYPAL_WEBHOOK_ID,
         "webhook_event": req.get_json(),
     }
-    response = requests.post(
+    response = http_client.post(
         config.PAYPAL_VERIFY_WEBHOOK_URL,
         headers=headers,
         data=json.dumps(data),
-        timeout=config.TIMEOUT,
     )
     assert response.status_code == 200
     assert response.json()["verification_status"] == "SUCCESS"
 
 
-def get_headers() -> dict[str, str]:
-    return {
+def get_headers(request_id: Optional[str] = None) -> dict[str, str]:
+    headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {get_access_token()}",
     }
+    if request_id is not None:
+        headers["PayPal-Request-Id"] = request_id
+    return headers
 
 
 def get_access_token() -> str:
+    if time.time() < token_cache["expiration"]:
+        return token_cache["token"]
+    with token_lock:
+        if time.time() >= token_cache["expiration"]:
+            token_cache["token"], token_cache["expiration"] = get_stored_access_token()
+        return token_cache["token"]
+
+
+def get_stored_access_token() -> tuple[str, float]:
     token_ref = firestore.client().collection("paypal_token_cache").document("token")
     token_doc = token_ref.get()
     if token_doc.exists and time.time() < token_doc.get("expiration"):
-        return token_doc.get("token")
+        return token_doc.get("token"), token_doc.get("expiration")
     token, expires_in = refresh_access_token()
-    token_ref.set({"token": token, "expiration": time.time() + expires_in - 600})
-    return token
+    expiration = time.time() + expires_in - 600
+    token_ref.set({"token": token, "expiration": expiration})
+    return token, expiration
 
 
 def refresh_access_token() -> tuple[str, int]:
     auth = (config.PAYPAL_CLIENT_ID, config.PAYPAL_CLIENT_SECRET)
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
     data = {"grant_type": "client_credentials"}
-    response = requests.post(
+    response = http_client.post(
         config.PAYPAL_OAUTH_URL,
         auth=auth,  # type: ignore
         headers=headers,
         data=data,
-        timeout=config.TIMEOUT,
     ).json()
     return response["access_token"], response["expires_in"]
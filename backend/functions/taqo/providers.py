@@ -0,0 +1,80 @@
+# pylint: disable=import-outside-toplevel
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, TypeVar
+
+from firebase_functions import logger
+from taqo import breaker, metrics
+
+MAX_ATTEMPTS = 4
+BASE_DELAY = 0.5  # seconds
+MAX_DELAY = 8.0  # seconds
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+T = TypeVar("T")
+
+
+class TransientError(Exception):
+    pass
+
+
+def idempotency_key(operation: str, transaction_id: str) -> str:
+    return f"{operation}-{transaction_id}"
+
+
+def check_response(response: Any) -> Any:
+    if response.status_code in TRANSIENT_STATUS_CODES:
+        raise TransientError(f"HTTP {response.status_code}: {response.text}")
+    return response
+
+
+def call(operation: str, func: Callable[[], T]) -> T:
+    provider = get_provider(operation)
+    attempt = 1
+    while True:
+        try:
+            return breaker.call(provider, func, is_transient)
+        except Exception as e:
+            if attempt >= MAX_ATTEMPTS or not is_transient(e):
+                raise
+            time.sleep(get_retry_delay(operation, attempt, e))
+        attempt += 1
+
+
+async def call_async(operation: str, func: Callable[[], Awaitable[T]]) -> T:
+    provider = get_provider(operation)
+    attempt = 1
+    while True:
+        try:
+            return await breaker.call_async(provider, func, is_transient)
+        except Exception as e:
+            if attempt >= MAX_ATTEMPTS or not is_transient(e):
+                raise
+            await asyncio.sleep(get_retry_delay(operation, attempt, e))
+        attempt += 1
+
+
+def get_provider(operation: str) -> str:
+    return operation.split(".")[0]
+
+
+def get_retry_delay(operation: str, attempt: int, error: Exception) -> float:
+    delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2**attempt))
+    logger.warn(f"{operation} failed on attempt {attempt}, retrying in {delay:.2f} seconds: {error!r}")
+    metrics.record(f"retry:{operation}", delay)
+    return delay
+
+
+def is_transient(error: Exception) -> bool:
+    import httpx
+    import requests
+    import stripe
+
+    if isinstance(error, (TransientError, requests.ConnectionError, requests.Timeout, httpx.TransportError)):
+        return True
+    if isinstance(error, stripe.APIConnectionError):
+        return True
+    if isinstance(error, stripe.StripeError):
+        return error.http_status in TRANSIENT_STATUS_CODES
+    return False
@@ -0,0 +1,49 @@
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from firebase_admin import firestore
+from firebase_functions import logger
+from google.cloud.firestore_v1.field_path import FieldPath
+from taqo import utils
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_TIME_BUDGET = 45  # seconds, leaves headroom within the 60 second scheduler timeout
+
+
+@dataclass(frozen=True)
+class Scan:
+    name: str
+    query: Any
+    order_field: str
+    batch_size: int = DEFAULT_BATCH_SIZE
+    time_budget: float = DEFAULT_TIME_BUDGET
+
+    # process_page gets the scan deadline and returns the first document it left for the next run, if any
+    def run(
+        self,
+        process_page: Callable[[list[firestore.DocumentSnapshot], float], Optional[firestore.DocumentSnapshot]],
+    ) -> None:
+        deadline = time.monotonic() + self.time_budget
+        query = self.query.order_by(self.order_field).order_by(FieldPath.document_id()).limit(self.batch_size)
+        cursor = utils.get_checkpoint(self.name)
+        while True:
+            page = list((query.start_after(cursor) if cursor else query).stream())
+            left = process_page(page, deadline)
+            if left is not None:
+                index = [document.id for document in page].index(left.id)
+                if index:
+                    utils.set_checkpoint(self.name, self.get_cursor(page[index - 1]))
+                logger.warn(f"Stopped {self.name} after {self.time_budget} seconds, resuming on the next run.")
+                return
+            if len(page) < self.batch_size:
+                utils.set_checkpoint(self.name, None)
+                return
+            cursor = self.get_cursor(page[-1])
+            utils.set_checkpoint(self.name, cursor)
+            if time.monotonic() >= deadline:
+                logger.warn(f"Stopped {self.name} after {self.time_budget} seconds, resuming on the next run.")
+                return
+
+    def get_cursor(self, document: firestore.DocumentSnapshot) -> list:
+        return [document.get(self.order_field), document.id]
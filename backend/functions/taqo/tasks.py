@@ -0,0 +1,100 @@
+import math
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Union
+
+from firebase_functions import logger
+from taqo import clients, config, metrics, utils
+
+WHEEL_TICK = 1.0  # seconds
+WHEEL_SLOTS = 512
+
+handlers: dict[str, Callable[[dict], None]] = {}
+
+
+def handler(f: Callable[[dict], None]) -> Callable[[dict], None]:
+    handlers[f.__name__] = f
+    return f
+
+
+def schedule(function_name: str, data: dict, run_at: int, task_id: str) -> None:
+    start = time.perf_counter()
+    clients.get("task_queue").enqueue(function_name, data, run_at, task_id)
+    metrics.record(f"tasks.enqueue:{function_name}", time.perf_counter() - start)
+
+
+class CloudTasksQueue:  # pylint: disable=too-few-public-methods
+    def enqueue(self, function_name: str, data: dict, run_at: int, task_id: str) -> None:
+        from firebase_admin import (  # pylint: disable=import-outside-toplevel
+            exceptions,
+            functions,
+        )
+
+        queue = functions.task_queue(f"locations/{config.REGION}/functions/{function_name}")
+        options = functions.TaskOptions(schedule_time=datetime.fromtimestamp(run_at, timezone.utc), task_id=task_id)
+        try:
+            queue.enqueue(data, options)
+        except exceptions.AlreadyExistsError:
+            pass  # the same task has been scheduled before
+
+
+@dataclass
+class Timer:
+    rounds: int
+    function_name: str
+    data: dict
+    task_id: str
+
+
+class TimerWheel:
+    def __init__(self, handlers_: dict[str, Callable[[dict], None]], start: bool = True) -> None:
+        self.handlers = handlers_
+        self.slots: list[list[Timer]] = [[] for _ in range(WHEEL_SLOTS)]
+        self.cursor = 0
+        self.task_ids: set[str] = set()
+        self.lock = threading.Lock()
+        if start:
+            threading.Thread(target=self.run, name="timer-wheel", daemon=True).start()
+
+    def enqueue(self, function_name: str, data: dict, run_at: int, task_id: str) -> None:
+        n_ticks = max(0, math.ceil((run_at - time.time()) / WHEEL_TICK))
+        rounds, offset = divmod(n_ticks, WHEEL_SLOTS)
+        with self.lock:
+            if task_id in self.task_ids:
+                return
+            self.task_ids.add(task_id)
+            self.slots[(self.cursor + offset) % WHEEL_SLOTS].append(Timer(rounds, function_name, data, task_id))
+
+    def advance(self) -> None:
+        with self.lock:
+            slot = self.slots[self.cursor]
+            due = [timer for timer in slot if timer.rounds == 0]
+            self.slots[self.cursor] = [timer for timer in slot if timer.rounds > 0]
+            for timer in self.slots[self.cursor]:
+                timer.rounds -= 1
+            self.cursor = (self.cursor + 1) % WHEEL_SLOTS
+            self.task_ids.difference_update(timer.task_id for timer in due)
+        for timer in due:
+            self.dispatch(timer)
+
+    def run(self) -> None:
+        next_tick = time.monotonic()
+        while True:
+            next_tick += WHEEL_TICK
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+            self.advance()
+
+    def dispatch(self, timer: Timer) -> None:
+        try:
+            self.handlers[timer.function_name](timer.data)
+        except Exception as e:
+            logger.error(utils.error_to_str(e))
+
+
+@clients.register("task_queue")
+def init_task_queue() -> Union[CloudTasksQueue, TimerWheel]:
+    if config.TASK_QUEUE == "local":
+        return TimerWheel(handlers)
+    return CloudTasksQueue()
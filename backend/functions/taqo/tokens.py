@@ -0,0 +1,40 @@
+# pylint: disable=protected-access
+import collections
+import hashlib
+import threading
+import time
+from typing import Any
+
+import firebase_admin
+from firebase_admin import _token_gen
+from firebase_functions import logger
+
+MAX_CACHED_TOKENS = 1000
+
+verified_tokens: collections.OrderedDict[str, dict[str, Any]] = collections.OrderedDict()
+lock = threading.Lock()
+
+
+def verify_id_token(id_token: str) -> dict[str, Any]:
+    key = hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+    with lock:
+        claims = verified_tokens.get(key)
+        if claims is not None and claims["exp"] > time.time():
+            verified_tokens.move_to_end(key)
+            return dict(claims)
+        verified_tokens.pop(key, None)
+    claims = firebase_admin.auth.verify_id_token(id_token)  # type: ignore
+    if "exp" in claims:
+        with lock:
+            verified_tokens[key] = dict(claims)
+            while len(verified_tokens) > MAX_CACHED_TOKENS:
+                verified_tokens.popitem(last=False)
+    return claims
+
+
+def warm_certificates() -> None:
+    try:
+        token_verifier = firebase_admin.auth._get_client(None)._token_verifier  # type: ignore
+        token_verifier.request(_token_gen.ID_TOKEN_CERT_URI)
+    except Exception as e:
+        logger.warn(f"Failed to warm token signing certificates: {e}")
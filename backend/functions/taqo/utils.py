@@ -1,29 +1,58 @@
+# pylint: disable=import-outside-toplevel
+import contextlib
+import contextvars
 import functools
 import json
 import math
 import pathlib
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Any, Callable, Union
+from html import escape
+from string import Template
+from typing import Any, Callable, Iterator, Optional, Union
 
 import firebase_admin
-import markdown2  # type: ignore
-import requests
 import taqo
-from firebase_admin import firestore, messaging
+from firebase_admin import firestore
 from firebase_functions import https_fn, logger, options
 from google import auth  # type: ignore
 from google.api_core import future
-from google.cloud import pubsub_v1  # type: ignore
-from taqo import config
+from google.cloud.firestore_v1.bulk_writer import BulkWriteFailure, BulkWriter
+from google.rpc import code_pb2  # type: ignore
+from taqo import cache, clients, config, metrics, tokens
 
 cors_options = options.CorsOptions(cors_origins="*", cors_methods=["get", "post"])
 
+MAX_BATCH_WRITES = 500
+MAX_BATCH_READS = 100
+MAX_WRITE_ATTEMPTS = 3
+
+MAX_MULTICAST_TOKENS = 500
+NOTIFICATION_WORKERS = 4
+
+pending_futures: contextvars.ContextVar[Optional[list[future.Future]]] = contextvars.ContextVar(
+    "pending_futures", default=None
+)
+
 
 def update_transaction(transaction_id: str, update_data: dict) -> None:
     db = firestore.client()
     transaction_ref = db.collection("transactions").document(transaction_id)
     transaction_ref.update(update_data)
+    cache.apply_update("transactions", transaction_id, update_data)
+
+
+def update_transactions(transaction_ids: list[str], update_data: dict) -> None:
+    db = firestore.client()
+    for i in range(0, len(transaction_ids), MAX_BATCH_WRITES):
+        batch = db.batch()
+        for transaction_id in transaction_ids[i : i + MAX_BATCH_WRITES]:
+            batch.update(db.collection("transactions").document(transaction_id), update_data)
+        batch.commit()
+    for transaction_id in transaction_ids:
+        cache.apply_update("transactions", transaction_id, update_data)
 
 
 def update_spot(spot_id: str, condition_func: Callable[[firestore.DocumentSnapshot], bool], update_data: dict) -> None:
@@ -38,8 +67,15 @@ def update_spot(spot_id: str, condition_func: Callable[[firestore.DocumentSnapsh
             transaction_.update(spot_ref, update_data)
         else:
             raise UpdateError
+        return spot
 
-    update_in_transaction(transaction)
+    try:
+        spot = update_in_transaction(transaction)
+    except UpdateError:
+        cache.invalidate("spots", spot_id)
+        raise
+    cache.put("spots", spot_id, spot)
+    cache.apply_update("spots", spot_id, update_data)
 
 
 def is_available(spot: firestore.DocumentSnapshot) -> bool:
@@ -54,31 +90,77 @@ class UpdateError(ValueError):
     pass
 
 
+def exists(query: firestore.Query) -> bool:
+    return any(True for _ in query.limit(1).stream())
+
+
+def count(query: firestore.Query) -> int:
+    result = query.count(alias="count").get()
+    return int(result[0][0].value)
+
+
+def get_checkpoint(name: str) -> Optional[list]:
+    db = firestore.client()
+    checkpoint = db.collection("checkpoints").document(name).get()
+    return checkpoint.get("cursor") if checkpoint.exists else None
+
+
+def set_checkpoint(name: str, cursor: Optional[list]) -> None:
+    db = firestore.client()
+    checkpoint_ref = db.collection("checkpoints").document(name)
+    if cursor is None:
+        checkpoint_ref.delete()
+    else:
+        checkpoint_ref.set({"cursor": cursor, "updatedAt": timestamp()})
+
+
+@contextlib.contextmanager
+def message_scope() -> Iterator[None]:
+    token = pending_futures.set([])
+    try:
+        yield
+    finally:
+        flush_messages()
+        pending_futures.reset(token)
+
+
+def message_scoped(f):
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        with message_scope():
+            return f(*args, **kwargs)
+
+    return wrapper
+
+
 def https_wrapper(f):
     @functools.wraps(f)
     def wrapper(request):
         if "keep-warm" in request.headers:
+            tokens.warm_certificates()
             return https_fn.Response("OK")
-        auth_header = request.headers.get("Authorization")
-        if not auth_header or not auth_header.startswith("Bearer "):
-            logger.error("Missing or invalid Authorization header")
-            return https_fn.Response("Log in to perform this action.", status=401)
-        id_token = auth_header.split()[1]
-        try:
-            decoded_token = firebase_admin.auth.verify_id_token(id_token)  # type: ignore
-        except Exception as e:
-            logger.error(error_to_str(e))
-            return https_fn.Response("Log in to perform this action.", status=401)
-        data = request.get_json()
-        data["userId"] = decoded_token["uid"]
-        logger.log(data, ff_type="request")
-        try:
-            response = f(data)
-            logger.log(response, ff_type="response")
-            return response if response is not None else https_fn.Response("OK")
-        except https_fn.HttpsError as e:
-            logger.error(error_to_str(e))
-            return https_fn.Response(e.message, status=400)
+        with metrics.request_scope(f.__name__):
+            auth_header = request.headers.get("Authorization")
+            if not auth_header or not auth_header.startswith("Bearer "):
+                logger.error("Missing or invalid Authorization header")
+                return https_fn.Response("Log in to perform this action.", status=401)
+            id_token = auth_header.split()[1]
+            try:
+                decoded_token = tokens.verify_id_token(id_token)
+            except Exception as e:
+                logger.error(error_to_str(e))
+                return https_fn.Response("Log in to perform this action.", status=401)
+            data = request.get_json()
+            data["userId"] = decoded_token["uid"]
+            logger.log(data, ff_type="request")
+            try:
+                with cache.request_scope(), message_scope():
+                    response = f(data)
+                logger.log(response, ff_type="response")
+                return response if response is not None else https_fn.Response("OK")
+            except https_fn.HttpsError as e:
+                logger.error(error_to_str(e))
+                return https_fn.Response(e.message, status=400)
 
     return wrapper
 
@@ -96,63 +178,137 @@ def tame_errors(f):
 
 
 def send_notification(user_ids: Union[str, list[str]], title: str, body: str, data: dict[str, str]) -> None:
-    messaging_tokens = get_messaging_tokens(user_ids)
-    if not messaging_tokens:
+    from firebase_admin import messaging
+
+    user_tokens = get_user_tokens(user_ids)
+    if not user_tokens:
         return
+    invalid_token_errors = (messaging.UnregisteredError, messaging.SenderIdMismatchError)
     notification = messaging.Notification(title=title, body=body)
-    message = messaging.MulticastMessage(
-        notification=notification,
-        data=data,
-        tokens=messaging_tokens,
-        apns=messaging.APNSConfig(payload=messaging.APNSPayload(aps=messaging.Aps(content_available=True))),
-        android=messaging.AndroidConfig(priority="high"),
-    )
-    messaging.send_each_for_multicast(message)
+
+    def send_chunk(chunk: list[tuple[firestore.DocumentSnapshot, str]]) -> messaging.BatchResponse:
+        message = messaging.MulticastMessage(
+            notification=notification,
+            data=data,
+            tokens=[token for _, token in chunk],
+            apns=messaging.APNSConfig(payload=messaging.APNSPayload(aps=messaging.Aps(content_available=True))),
+            android=messaging.AndroidConfig(priority="high"),
+        )
+        return messaging.send_each_for_multicast(message)
+
+    chunks = [user_tokens[i : i + MAX_MULTICAST_TOKENS] for i in range(0, len(user_tokens), MAX_MULTICAST_TOKENS)]
+    with ThreadPoolExecutor(max_workers=NOTIFICATION_WORKERS) as executor:
+        batch_responses = list(executor.map(metrics.propagate(send_chunk), chunks))
+    stale_users = [
+        user
+        for chunk, batch_response in zip(chunks, batch_responses)
+        for (user, _), response in zip(chunk, batch_response.responses)
+        if not response.success and isinstance(response.exception, invalid_token_errors)
+    ]
+    prune_messaging_tokens(stale_users)
+
+
+def prune_messaging_tokens(users: list[firestore.DocumentSnapshot]) -> None:
+    if not users:
+        return
+    db = firestore.client()
+    bulk_writer = db.bulk_writer()
+    bulk_writer.on_write_error(retry_write_error)
+    for user in users:
+        option = db.write_option(last_update_time=user.update_time)
+        bulk_writer.update(user.reference, {"messagingToken": firestore.DELETE_FIELD}, option=option)
+    bulk_writer.close()
+    logger.log(f"Removed invalid messaging tokens of users {[user.id for user in users]}.")
+
+
+def retry_write_error(error: BulkWriteFailure, _bulk_writer: BulkWriter) -> bool:
+    return error.code != code_pb2.FAILED_PRECONDITION and error.attempts < MAX_WRITE_ATTEMPTS
 
 
 def get_messaging_tokens(user_ids: Union[str, list[str]]) -> list[str]:
-    db = firestore.client()
+    return [messaging_token for _, messaging_token in get_user_tokens(user_ids)]
+
+
+def get_user_tokens(user_ids: Union[str, list[str]]) -> list[tuple[firestore.DocumentSnapshot, str]]:
     if not isinstance(user_ids, list):
         user_ids = [user_ids]
-    messaging_tokens = []
-    for user_id in user_ids:
-        user_ref = db.collection("users").document(user_id)
-        try:
-            messaging_token = user_ref.get().get("messagingToken")
-            if messaging_token:
-                messaging_tokens.append(messaging_token)
-        except KeyError:
-            continue
-    return messaging_tokens
+    users = get_documents("users", user_ids, field_paths=["messagingToken"])
+    user_tokens = []
+    for user_id in dict.fromkeys(user_ids):
+        user = users[user_id]
+        messaging_token = user.to_dict().get("messagingToken") if user.exists else None
+        if messaging_token:
+            user_tokens.append((user, messaging_token))
+    return user_tokens
+
+
+def get_documents(
+    collection: str, document_ids: list[str], field_paths: Optional[list[str]] = None
+) -> dict[str, firestore.DocumentSnapshot]:
+    db = firestore.client()
+    unique_ids = list(dict.fromkeys(document_ids))
+    documents = {}
+    for i in range(0, len(unique_ids), MAX_BATCH_READS):
+        refs = [db.collection(collection).document(document_id) for document_id in unique_ids[i : i + MAX_BATCH_READS]]
+        for snapshot in db.get_all(refs, field_paths=field_paths):
+            documents[snapshot.id] = snapshot
+    return documents
+
 
+def send_email(to: str, subject: str, body: str, html: Optional[str] = None) -> None:
+    import markdown2  # type: ignore
+    from taqo import http_client, providers
 
-def send_email(to: str, subject: str, body: str) -> None:
     if "@" not in to:
         to = get_email_address(to)
-    response = requests.post(
-        config.MAILGUN_URL,  # type: ignore
-        auth=("api", config.MAILGUN_API_KEY),  # type: ignore
-        data={
-            "from": f"Taqo <{config.OUTBOUND_EMAIL}>",
-            "to": to,
-            "subject": subject,
-            "html": markdown2.markdown(body),
-            "text": body,
-        },
-        timeout=config.TIMEOUT,
+    data = {
+        "from": f"Taqo <{config.OUTBOUND_EMAIL}>",
+        "to": to,
+        "subject": subject,
+        "html": html if html is not None else markdown2.markdown(body),
+        "text": body,
+    }
+    response = providers.call(
+        "mailgun.send",
+        lambda: providers.check_response(
+            http_client.post(config.MAILGUN_URL, auth=("api", config.MAILGUN_API_KEY), data=data)  # type: ignore
+        ),
     )
     assert response.status_code == 200
 
 
+def send_template_email(to: str, subject: str, template: str, variables: dict[str, str]) -> None:
+    body, html = render_email(template, variables)
+    send_email(to, subject, body, html)
+
+
 def get_email_address(user_id: str) -> str:
     user = firebase_admin.auth.get_user(user_id)  # type: ignore
     return user.email
 
 
 def get_email(name: str) -> str:
-    path = functions_root() / "resources" / "email_templates" / f"{name}.md"
-    with open(path, "r", encoding="utf-8") as file:
-        return file.read()
+    body, _ = get_email_templates()[name]
+    return body
+
+
+def render_email(name: str, variables: dict[str, str]) -> tuple[str, str]:
+    body, html = get_email_templates()[name]
+    if not variables:
+        return body, html
+    escaped_variables = {key: escape(str(value)) for key, value in variables.items()}
+    return Template(body).safe_substitute(variables), Template(html).safe_substitute(escaped_variables)
+
+
+@functools.cache
+def get_email_templates() -> dict[str, tuple[str, str]]:
+    import markdown2  # type: ignore
+
+    templates = {}
+    for path in (functions_root() / "resources" / "email_templates").glob("*.md"):
+        body = path.read_text(encoding="utf-8")
+        templates[path.stem] = (body, markdown2.markdown(body))
+    return templates
 
 
 def functions_root() -> pathlib.Path:
@@ -165,6 +321,16 @@ def enqueue_email(to: str, subject: str, body: str, block: bool) -> future.Futur
     return publish_message("send-email", data, block)
 
 
+@tame_errors
+def enqueue_template_email(
+    to: str, subject: str, template: str, block: bool, variables: Optional[dict[str, str]] = None
+) -> future.Future:
+    variables = variables or {}
+    body, _ = render_email(template, variables)
+    data = {"to": to, "subject": subject, "body": body, "template": template, "variables": variables}
+    return publish_message("send-email", data, block)
+
+
 @tame_errors
 def enqueue_notification(
     user_ids: Union[str, list[str]],
@@ -178,20 +344,42 @@ def enqueue_notification(
 
 
 def publish_message(topic: str, data: dict[str, Any], block: bool) -> future.Future:
+    start = time.perf_counter()
     message = json.dumps(data).encode("utf-8")
-    publisher = pubsub_v1.PublisherClient()
-    topic_path = publisher.topic_path(get_project_id(), topic)
-    future_ = publisher.publish(topic_path, message)
-    if block:
+    future_ = get_publisher().publish(get_topic_path(topic), message)
+    futures = pending_futures.get()
+    if block or futures is None:
         future_.result()
+    else:
+        futures.append(future_)
+    metrics.record(f"pubsub.publish:{topic}", time.perf_counter() - start, n_bytes=len(message))
     return future_
 
 
+def get_publisher() -> Any:
+    return clients.get("publisher")
+
+
+@functools.cache
+def get_topic_path(topic: str) -> str:
+    return get_publisher().topic_path(get_project_id(), topic)
+
+
+@functools.cache
 def get_project_id() -> str:
     _, project_id = auth.default()
     return project_id
 
 
+def flush_messages() -> None:
+    futures = pending_futures.get()
+    if not futures:
+        return
+    pending, futures[:] = futures.copy(), []
+    for future_ in pending:
+        resolve_futures(future_)
+
+
 @tame_errors
 def resolve_futures(*futures: future.Future) -> None:
     for future_ in futures:
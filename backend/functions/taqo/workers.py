@@ -0,0 +1,70 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, TypeVar
+
+from firebase_functions import logger
+from taqo import metrics, utils
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class ProviderLimit:
+    max_workers: int
+    requests_per_second: float
+
+
+class RateLimiter:  # pylint: disable=too-few-public-methods
+    def __init__(self, requests_per_second: float) -> None:
+        self.interval = 1 / requests_per_second
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, deadline: float = math.inf) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            if slot >= deadline:
+                return False
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+        return True
+
+
+def run_by_provider(
+    func: Callable[[T], Any],
+    items: list[T],
+    get_provider: Callable[[T], str],
+    limits: dict[str, ProviderLimit],
+    deadline: float = math.inf,
+) -> list[Optional[Exception]]:
+    executors = {provider: ThreadPoolExecutor(max_workers=limit.max_workers) for provider, limit in limits.items()}
+    rate_limiters = {provider: RateLimiter(limit.requests_per_second) for provider, limit in limits.items()}
+
+    def call(item: T, rate_limiter: RateLimiter) -> Optional[Exception]:
+        if not rate_limiter.acquire(deadline):
+            return DeadlineExceeded()
+        try:
+            func(item)
+            return None
+        except Exception as e:
+            logger.error(utils.error_to_str(e))
+            return e
+
+    try:
+        futures = []
+        for item in items:
+            provider = get_provider(item)
+            futures.append(executors[provider].submit(metrics.propagate(call), item, rate_limiters[provider]))
+        return [future_.result() for future_ in futures]
+    finally:
+        for executor in executors.values():
+            executor.shutdown()
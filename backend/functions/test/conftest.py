@@ -8,7 +8,7 @@ import pytest
 import requests
 import stripe
 from firebase_admin import firestore
-from taqo import config, core, utils
+from taqo import breaker, clients, config, core, tasks, utils
 
 stripe.api_key = config.STRIPE_API_KEY
 
@@ -23,6 +23,11 @@ def use_firestore_emulator():
         process.terminate()
 
 
+@pytest.fixture(scope="session", autouse=True)
+def use_local_task_queue():
+    clients.instances["task_queue"] = tasks.TimerWheel(tasks.handlers)
+
+
 @pytest.fixture(scope="session")
 def db():
     return firestore.client()
@@ -32,6 +37,15 @@ def db():
 def clear_db():
     url = f"http://localhost:8080/emulator/v1/projects/{utils.get_project_id()}/databases/(default)/documents"
     requests.delete(url, timeout=config.TIMEOUT)
+    breaker.reset()
+
+
+@pytest.fixture
+def closed_breakers(mocker):
+    mocker.patch("taqo.breaker.Breaker.refresh")
+    breaker.reset()
+    yield
+    breaker.reset()
 
 
 @pytest.fixture
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+from unittest import mock
+
+import pytest
+from firebase_functions import https_fn
+from taqo import aio, cache, clients, core, paypal
+
+
+def test_run_propagates_request_scope():
+    async def get_cached_documents():
+        return cache.documents.get()
+
+    with cache.request_scope():
+        assert aio.run(get_cached_documents()) is cache.documents.get()
+
+
+@pytest.mark.usefixtures("closed_breakers")
+def test_payment_sheet_calls_stripe_concurrently(mocker):
+    in_flight, max_in_flight = 0, 0
+
+    async def stripe_call(**_kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return mock.Mock(id="pi_1", client_secret="pi_1_secret", secret="ephkey_1")
+
+    stripe = mock.Mock()
+    stripe.EphemeralKey.create_async = stripe_call
+    stripe.PaymentIntent.create_async = stripe_call
+    mocker.patch.dict(clients.instances, {"stripe": stripe})
+    transaction_ref = mock.Mock(id="transaction1", update=mock.AsyncMock())
+    mocker.patch("taqo.aio.get_stripe_customer_id", mock.AsyncMock(return_value="cus_1"))
+    mocker.patch("taqo.aio.create_transaction", mock.AsyncMock(return_value=(transaction_ref, {"buyerPrice": 12.5})))
+
+    response = aio.run(aio.payment_sheet("spot1", "buyer1"))
+
+    assert max_in_flight == 2
+    assert response == {
+        "paymentIntentClientSecret": "pi_1_secret",
+        "transactionId": "transaction1",
+        "ephemeralKey": "ephkey_1",
+        "customer": "cus_1",
+    }
+    transaction_ref.update.assert_awaited_once_with({"paymentIntentId": "pi_1"})
+
+
+def test_resolve_futures_logs_errors(mocker):
+    error = mocker.patch("taqo.aio.logger.error")
+    failed = aio.concurrent.futures.Future()
+    failed.set_exception(ValueError("publish failed"))
+    succeeded = aio.concurrent.futures.Future()
+    succeeded.set_result("message1")
+    aio.run(aio.resolve_futures(failed, succeeded, None))
+    assert error.call_count == 1
+
+
+def test_notify_stakeholders_runs_blocking_calls_off_the_event_loop(mocker):
+    thread_names = []
+
+    def notify(*_args):
+        thread_names.append(threading.current_thread().name)
+        published = aio.concurrent.futures.Future()
+        published.set_result("message1")
+        return published
+
+    mocker.patch("taqo.core.notify_seller_of_sale", side_effect=lambda *args: (notify(*args), notify(*args)))
+    mocker.patch("taqo.core.notify_buyer_of_sale", side_effect=notify)
+    mocker.patch("taqo.core.notify_operators_of_sale", side_effect=notify)
+    aio.run(aio.notify_stakeholders("spot1", "transaction1"))
+    assert len(thread_names) == 4
+    assert "event-loop" not in thread_names
+
+
+def test_get_stripe_customer_id(sample_data, third_user):  # pylint: disable=unused-argument
+    customer_id = aio.run(aio.get_stripe_customer_id(third_user["uid"]))
+    assert customer_id == third_user["stripeCustomerId"]
+
+
+def test_capture_order(transaction):
+    transaction_id = transaction.id
+    response = paypal.create_order(transaction_id)
+    order_id = response["id"]
+    with pytest.raises(https_fn.HttpsError) as error:
+        aio.run(aio.capture_order(transaction_id, order_id))
+    assert error.value.code == https_fn.FunctionsErrorCode.ABORTED
+    assert error.value.message == "ff_error/payment_failed"
+    assert transaction.get().get("status") == "payment_failed"
+
+
+def test_book_spot(mocker, db, sample_data, transaction):
+    spot_id = sample_data
+    transaction_id = transaction.id
+    spot_ref = db.collection("spots").document(spot_id)
+    schedule = mocker.patch("taqo.tasks.schedule")
+    assert aio.run(aio.book_spot(spot_id, transaction_id, sell=False, initiate_refund=False)) is None
+    assert spot_ref.get().get("status") == "reserved"
+    assert transaction.get().get("status") == "pending"
+    assert schedule.call_args.args[1] == {"spotId": spot_id, "reservedAt": spot_ref.get().get("reservedAt")}
+    assert aio.run(aio.book_spot(spot_id, transaction_id, sell=True, initiate_refund=True)) is None
+    assert schedule.call_count == 1
+    assert spot_ref.get().get("status") == "sold"
+    assert transaction.get().get("status") == "charged_buyer"
+    assert transaction.get().get("payout_status") == "payout_pending"
+
+
+def test_book_spot_unavailable(db, sample_data, transaction):
+    spot_id = sample_data
+    transaction_id = transaction.id
+    spot_ref = db.collection("spots").document(spot_id)
+    spot_ref.update({"status": "sold"})
+    assert aio.run(aio.book_spot(spot_id, transaction_id, sell=True, initiate_refund=True)) == "spot_unavailable"
+    assert spot_ref.get().get("status") == "sold"
+    assert transaction.get().get("status") == "to_refund"
+
+
+def test_book_spot_invalid_price(db, sample_data, transaction):
+    spot_id = sample_data
+    transaction_id = transaction.id
+    spot_ref = db.collection("spots").document(spot_id)
+    core.reserve_spot(spot_id)
+    spot_ref.update({"buyerPrice": 100})
+    assert aio.run(aio.book_spot(spot_id, transaction_id, sell=True, initiate_refund=True)) == "invalid_spot_price"
+    assert spot_ref.get().get("status") == "available"
+    assert transaction.get().get("status") == "to_refund"
+
+
+def test_stripe_book_spot_unavailable(db, sample_data, transaction):
+    spot_id = sample_data
+    db.collection("spots").document(spot_id).update({"status": "deleted"})
+    with pytest.raises(https_fn.HttpsError) as error:
+        aio.run(aio.stripe_book_spot(spot_id, transaction.id))
+    assert error.value.message == "ff_error/spot_unavailable"
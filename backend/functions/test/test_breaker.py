@@ -0,0 +1,33 @@
+import time
+
+import pytest
+from taqo import breaker
+
+
+def test_opens_after_failures_and_closes_after_trial(mocker, db, clear_db):  # pylint: disable=unused-argument
+    mocker.patch("taqo.breaker.OPEN_DURATION", 1)
+    failing = mocker.Mock(side_effect=TimeoutError)
+    for _ in range(breaker.MIN_CALLS):
+        with pytest.raises(TimeoutError):
+            breaker.call("paypal", failing, lambda _: True)
+    succeeding = mocker.Mock(return_value="ok")
+    with pytest.raises(breaker.CircuitOpenError):
+        breaker.call("paypal", succeeding, lambda _: True)
+    assert not succeeding.called
+    assert db.collection("breakers").document("paypal").get().get("state") == "open"
+
+    breaker.reset()
+    assert breaker.is_open("paypal")
+
+    time.sleep(1.1)
+    assert breaker.call("paypal", succeeding, lambda _: True) == "ok"
+    assert db.collection("breakers").document("paypal").get().get("state") == "closed"
+    assert not breaker.is_open("paypal")
+
+
+def test_permanent_errors_do_not_open(mocker, clear_db):  # pylint: disable=unused-argument
+    failing = mocker.Mock(side_effect=ValueError)
+    for _ in range(breaker.MIN_CALLS):
+        with pytest.raises(ValueError):
+            breaker.call("stripe", failing, lambda _: False)
+    assert not breaker.is_open("stripe")
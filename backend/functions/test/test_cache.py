@@ -0,0 +1,28 @@
+from taqo import cache, utils
+
+
+def test_cache_is_request_scoped(db, sample_data):
+    spot_id = sample_data
+    spot_ref = db.collection("spots").document(spot_id)
+    with cache.request_scope():
+        assert cache.get("spots", spot_id).get("progress") == 75
+        spot_ref.update({"progress": 80})
+        assert cache.get("spots", spot_id).get("progress") == 75
+    assert cache.get("spots", spot_id).get("progress") == 80
+
+
+def test_cache_applies_own_writes(sample_data):
+    spot_id = sample_data
+    with cache.request_scope():
+        assert cache.get("spots", spot_id).get("status") == "available"
+        utils.update_spot(spot_id, utils.is_available, {"status": "reserved"})
+        assert cache.get("spots", spot_id).get("status") == "reserved"
+        assert cache.get("spots", spot_id).get("queueName") == "Ice Cream Shop"
+
+
+def test_cache_invalidates_on_transforms(sample_data):
+    spot_id = sample_data
+    with cache.request_scope():
+        cache.get("spots", spot_id)
+        cache.apply_update("spots", spot_id, {"progress.value": 10})
+        assert ("spots", spot_id) not in cache.documents.get()
@@ -0,0 +1,11 @@
+from taqo import clients, config
+
+
+def test_paypal_pool_size():
+    adapter = clients.get("http_session").get_adapter(config.PAYPAL_ORDERS_URL)
+    assert adapter._pool_maxsize == clients.PAYPAL_POOL_SIZE  # pylint: disable=protected-access
+
+
+def test_default_pool_size():
+    adapter = clients.get("http_session").get_adapter("https://example.com/path")
+    assert adapter._pool_maxsize == clients.DEFAULT_POOL_SIZE  # pylint: disable=protected-access
@@ -39,7 +39,39 @@ def test_notify_interested_buyers(db, sample_data, ios_user):
     core.notify_interested_buyers(spot_id, 10)
     spot_ref = db.collection("spots").document(spot_id)
     spot_ref.update({"interestedBuyerIds": firestore.ArrayUnion([ios_user["uid"]])})  # type: ignore
-    core.notify_interested_buyers(spot_id, 10)
+    with utils.message_scope():
+        core.notify_interested_buyers(spot_id, 10)
+
+
+def test_send_price_notifications(mocker, db, sample_data, ios_user):
+    spot_id = sample_data
+    spot_ref = db.collection("spots").document(spot_id)
+    spot_ref.update({"interestedBuyerIds": [ios_user["uid"]], "sellerPrice": 100, "buyerPrice": 125})
+    enqueue_notification = mocker.patch("taqo.utils.enqueue_notification")
+    mocker.patch("taqo.config.PRICE_NOTIFICATION_DELAY", 0)
+
+    core.update_spot(spot_id, 10, 90)
+    core.update_spot(spot_id, 20, 80)
+    core.update_spot(spot_id, 30, 85)
+    assert not enqueue_notification.called
+
+    core.send_price_notifications()
+    enqueue_notification.assert_called_once()
+    assert utils.format_price(utils.add_service_fee(85)) in enqueue_notification.call_args.kwargs["body"]
+    assert not db.collection("price_notifications").document(spot_id).get().exists
+
+
+def test_expire_reservation(mocker, db, sample_data):
+    spot_id = sample_data
+    schedule = mocker.patch("taqo.tasks.schedule")
+    core.reserve_spot(spot_id)
+    data = schedule.call_args.args[1]
+    assert schedule.call_args.kwargs["run_at"] == data["reservedAt"] + core.RESERVATION_TTL * 60
+
+    core.expire_reservation({**data, "reservedAt": data["reservedAt"] - 1})
+    assert db.collection("spots").document(spot_id).get().get("status") == "reserved"
+    core.expire_reservation(data)
+    assert db.collection("spots").document(spot_id).get().get("status") == "available"
 
 
 def test_free_spots(db):
@@ -62,30 +94,21 @@ def test_free_spots(db):
     assert get_status("spot4") == "sold"
 
 
-def test_ensure_spot_is_reserved(db, sample_data, transaction):
-    spot_id = sample_data
-    transaction_id = transaction.id
-    spot_ref = db.collection("spots").document(spot_id)
-    assert spot_ref.get().get("status") == "available"
-    core.ensure_spot_is_reserved(spot_id, transaction_id, initiate_refund=True)
-    assert spot_ref.get().get("status") == "reserved"
-    assert transaction.get().get("status") == "pending"
-    core.ensure_spot_is_reserved(spot_id, transaction_id, initiate_refund=True)
-    assert spot_ref.get().get("status") == "reserved"
-    assert transaction.get().get("status") == "pending"
-    utils.update_spot(spot_id, utils.is_reserved, {"status": "sold"})
-    with pytest.raises(https_fn.HttpsError):
-        core.ensure_spot_is_reserved(spot_id, transaction_id, initiate_refund=True)
-    assert spot_ref.get().get("status") == "sold"
-    assert transaction.get().get("status") == "to_refund"
+def test_free_spots_resumes_from_checkpoint(db, clear_db):  # pylint: disable=unused-argument
+    def get_status(spot_id):
+        return db.collection("spots").document(spot_id).get().get("status")
 
+    db.collection("spots").document("spot1").set({"status": "reserved", "reservedAt": utils.timestamp(10)})
+    db.collection("spots").document("spot2").set({"status": "reserved", "reservedAt": utils.timestamp(6)})
 
-def test_is_price_consistent(sample_data, transaction):
-    spot_id = sample_data
-    transaction_id = transaction.id
-    assert core.is_price_consistent(spot_id, transaction_id)
-    core.update_spot(spot_id, progress=10, seller_price=100)
-    assert not core.is_price_consistent(spot_id, transaction_id)
+    core.free_spots(batch_size=1, time_budget=0)
+    assert get_status("spot1") == "available"
+    assert get_status("spot2") == "reserved"
+    assert utils.get_checkpoint("free_spots") is not None
+
+    core.free_spots()
+    assert get_status("spot2") == "available"
+    assert utils.get_checkpoint("free_spots") is None
 
 
 def test_has_open_spots(sample_data, third_user):  # pylint: disable=unused-argument
@@ -0,0 +1,64 @@
+from taqo import lease
+
+
+def test_acquire_and_release(db, clear_db):  # pylint: disable=unused-argument
+    first = lease.acquire("refund_buyers", ttl=60)
+    assert first is not None
+    assert lease.acquire("refund_buyers", ttl=60) is None
+    lease.release(first)
+    second = lease.acquire("refund_buyers", ttl=60)
+    assert second is not None
+    assert second.token == first.token + 1
+    lease.release(first)
+    assert lease.acquire("refund_buyers", ttl=60) is None
+
+
+def test_held_skips_when_taken(db, clear_db):  # pylint: disable=unused-argument
+    with lease.held("pay_sellers", ttl=60) as first:
+        assert first is not None
+        with lease.held("pay_sellers", ttl=60) as second:
+            assert second is None
+    with lease.held("pay_sellers", ttl=60) as third:
+        assert third is not None
+
+
+def test_claim(db, clear_db):  # pylint: disable=unused-argument
+    for i in range(3):
+        db.collection("transactions").document(f"transaction{i}").set({"status": "to_refund"})
+    snapshots = list(db.collection("transactions").stream())
+    first = lease.Lease("refund_buyers", "worker1", token=1, expires_at=2**31)
+    second = lease.Lease("refund_buyers", "worker2", token=1, expires_at=2**31)
+    assert [doc.id for doc in lease.claim(first, snapshots[:2])] == ["transaction0", "transaction1"]
+    assert [doc.id for doc in lease.claim(second, snapshots)] == ["transaction2"]
+
+    snapshots = list(db.collection("transactions").stream())
+    newer = lease.Lease("refund_buyers", "worker3", token=2, expires_at=2**31)
+    assert len(lease.claim(newer, snapshots)) == 3
+
+
+def test_confirm_and_update_fence_out_stale_runs(db, clear_db):  # pylint: disable=unused-argument
+    for i in range(2):
+        db.collection("transactions").document(f"transaction{i}").set({"status": "to_refund"})
+    snapshots = list(db.collection("transactions").stream())
+    stale = lease.Lease("refund_buyers", "worker1", token=1, expires_at=2**31)
+    assert len(lease.claim(stale, snapshots)) == 2
+    assert [doc.id for doc in lease.confirm(stale, snapshots)] == ["transaction0", "transaction1"]
+
+    snapshots = list(db.collection("transactions").stream())
+    newer = lease.Lease("refund_buyers", "worker2", token=2, expires_at=2**31)
+    assert len(lease.claim(newer, snapshots[:1])) == 1
+    assert [doc.id for doc in lease.confirm(stale, snapshots)] == ["transaction1"]
+    assert lease.update(stale, snapshots, {"status": "payment_refunded"}) == ["transaction1"]
+    assert db.collection("transactions").document("transaction0").get().get("status") == "to_refund"
+    assert db.collection("transactions").document("transaction1").get().get("status") == "payment_refunded"
+
+
+def test_confirm_skips_expired_claims(db, clear_db):  # pylint: disable=unused-argument
+    db.collection("transactions").document("transaction0").set({"status": "to_refund"})
+    snapshots = list(db.collection("transactions").stream())
+    expired = lease.Lease("refund_buyers", "worker1", token=1, expires_at=1)
+    db.collection("transactions").document("transaction0").update(
+        {"claim": {"lease": "refund_buyers", "token": 1, "expiresAt": 1}}
+    )
+    assert not lease.confirm(expired, snapshots)
+    assert lease.update(expired, snapshots, {"status": "payment_refunded"}) == ["transaction0"]
@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from taqo import metrics, utils
+
+
+def test_request_scope_logs_summary(mocker):
+    log = mocker.patch("taqo.metrics.logger.log")
+    with metrics.request_scope("reserve_spot"):
+        metrics.record("firestore.get:spots", 0.01, documents=1, n_bytes=100)
+        metrics.record("firestore.get:spots", 0.02, documents=1, n_bytes=100)
+        metrics.record("firestore.transaction", 0.03, documents=2)
+        metrics.record("http.post:api-m.paypal.com", 0.2, n_bytes=50)
+    summary = log.call_args.args[0]
+    assert log.call_args.kwargs == {"ff_type": "metrics"}
+    assert summary["endpoint"] == "reserve_spot"
+    assert summary["firestore_reads"] == 2
+    assert summary["firestore_writes"] == 2
+    assert summary["firestore_transactions"] == 1
+    assert summary["bytes"] == 250
+    assert summary["operations"]["firestore.get:spots"]["calls"] == 2
+
+
+def test_record_outside_of_request_scope_is_ignored():
+    metrics.record("firestore.get:spots", 0.01, documents=1)
+    assert metrics.current.get() is None
+
+
+def test_propagate_records_from_worker_threads(mocker):
+    mocker.patch("taqo.metrics.logger.log")
+    with metrics.request_scope("refund_buyers") as request_metrics:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(metrics.propagate(lambda _: metrics.record("http.post:api.stripe.com", 0.1)), range(8)))
+    assert request_metrics.operations["http.post:api.stripe.com"].calls == 8
+
+
+def test_instrumentation_errors_never_block_the_wrapped_call(mocker):
+    mocker.patch("taqo.metrics.record", side_effect=RuntimeError)
+    warn = mocker.patch("taqo.metrics.logger.warn")
+    commit = metrics.wrap_commit("firestore.batch", lambda _self: "committed")
+    get = metrics.wrap_get(lambda _self: "snapshot")
+    assert commit(object()) == "committed"
+    assert get(object()) == "snapshot"
+    assert warn.call_count == 2
+
+
+def test_patch_skips_missing_methods(mocker):
+    warn = mocker.patch("taqo.metrics.logger.warn")
+
+    class Transaction:  # pylint: disable=too-few-public-methods
+        pass
+
+    metrics.patch(Transaction, "_commit", metrics.wrap_get)
+    assert not hasattr(Transaction, "_commit")
+    warn.assert_called_once()
+
+
+def test_instrument_counts_firestore_operations(mocker, db, sample_data):
+    spot_id = sample_data
+    log = mocker.patch("taqo.metrics.logger.log")
+    metrics.instrument()
+    with metrics.request_scope("update_spot"):
+        utils.update_spot(spot_id, utils.is_available, {"progress": 80})
+        db.collection("spots").document(spot_id).get()
+        list(db.collection("spots").where("status", "==", "available").stream())
+    summary = log.call_args.args[0]
+    assert summary["firestore_transactions"] == 1
+    assert summary["operations"]["firestore.get:spots"]["documents"] == 2
+    assert summary["operations"]["firestore.query:spots"]["calls"] == 1
+    assert summary["operations"]["firestore.transaction"]["documents"] == 1
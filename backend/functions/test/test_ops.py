@@ -0,0 +1,59 @@
+from firebase_admin import firestore
+from taqo import config, ops
+
+
+def event(subject, ids):
+    return firestore.DocumentSnapshot(None, {"subject": subject, "ids": ids}, True, None, None, None)
+
+
+def test_format_digest():
+    events = [
+        event("Spot Sold", {"Spot IDs": ["spot1"], "Transaction IDs": ["transaction1"]}),
+        event("Payout Failed", {"Transaction IDs": ["transaction2", "transaction3"]}),
+        event("Spot Sold", {"Spot IDs": ["spot4"], "Transaction IDs": ["transaction4"]}),
+    ]
+    assert ops.format_digest(events) == (
+        "Spot Sold: 2\n\nSpot IDs: spot1, spot4\nTransaction IDs: transaction1, transaction4\n\n"
+        "Payout Failed: 1\n\nTransaction IDs: transaction2, transaction3"
+    )
+
+
+def test_record_event_alerts_above_threshold(mocker, db, clear_db):  # pylint: disable=unused-argument
+    enqueue_email = mocker.patch("taqo.utils.enqueue_email")
+    mocker.patch("taqo.config.OPS_ALERT_THRESHOLD", 2)
+    ops.record_event("Spot Sold", {"Transaction IDs": ["transaction1"]})
+    ops.record_event("Refund Failed", {"Transaction IDs": ["transaction2"]}, failure=True)
+    assert not enqueue_email.called
+    ops.record_event("Refund Failed", {"Transaction IDs": ["transaction3"]}, failure=True)
+    ops.record_event("Refund Failed", {"Transaction IDs": ["transaction4"]}, failure=True)
+    enqueue_email.assert_called_once_with(
+        config.OPS_EMAIL, "Refund Failed", "Transaction IDs: transaction3", block=True
+    )
+
+
+def test_send_digest(mocker, db, clear_db):  # pylint: disable=unused-argument
+    enqueue_email = mocker.patch("taqo.utils.enqueue_email")
+    ops.send_digest()
+    assert not enqueue_email.called
+    ops.record_event("Spot Sold", {"Transaction IDs": ["transaction1"]})
+    ops.record_event("Spot Sold", {"Transaction IDs": ["transaction2"]})
+    ops.send_digest()
+    enqueue_email.assert_called_once_with(
+        config.OPS_EMAIL, ops.DIGEST_SUBJECT, "Spot Sold: 2\n\nTransaction IDs: transaction1, transaction2", block=True
+    )
+    assert not list(db.collection("ops_events").stream())
+
+
+def test_send_digest_in_pages(mocker, db, clear_db):  # pylint: disable=unused-argument
+    enqueue_email = mocker.patch("taqo.utils.enqueue_email")
+    mocker.patch("taqo.ops.DIGEST_PAGE_SIZE", 2)
+    for i in range(3):
+        ops.record_event("Spot Sold", {"Transaction IDs": [f"transaction{i}"]})
+    ops.send_digest()
+    enqueue_email.assert_called_once_with(
+        config.OPS_EMAIL,
+        ops.DIGEST_SUBJECT,
+        "Spot Sold: 3\n\nTransaction IDs: transaction0, transaction1, transaction2",
+        block=True,
+    )
+    assert not list(db.collection("ops_events").stream())
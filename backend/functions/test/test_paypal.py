@@ -1,8 +1,7 @@
 import time
 
-import pytest
 import requests
-from firebase_functions import https_fn
+from firebase_admin import firestore
 from taqo import config, paypal
 
 
@@ -11,36 +10,54 @@ def test_create_order(transaction):
     assert "id" in response
 
 
-def test_capture_order(transaction):
-    transaction_id = transaction.id
-    response = paypal.create_order(transaction_id)
-    order_id = response["id"]
-    with pytest.raises(https_fn.HttpsError) as error:
-        paypal.capture_order(transaction_id, order_id)
-    assert error.value.code == https_fn.FunctionsErrorCode.ABORTED
-    assert error.value.message == "ff_error/payment_failed"
-    assert transaction.get().get("status") == "payment_failed"
-
-
-def test_payout(transaction):
-    payout_batch_id = paypal.payout(transaction.id)
+def test_batch_payout(db, transaction):
+    transactions = [transaction.get()]
+    payout_batch_id = paypal.batch_payout(transactions, paypal.get_receivers(transactions))
+    sender_batch_id = paypal.get_sender_batch_id([transaction.id])
+    batch = db.collection("payout_batches").document(sender_batch_id).get()
+    assert batch.get("payoutBatchId") == payout_batch_id
     time.sleep(3)
     response = requests.get(
         f"{config.PAYPAL_PAYOUTS_URL}/{payout_batch_id}",
         headers=paypal.get_headers(),
         timeout=config.TIMEOUT,
     )
-    batch_status = response.json()["batch_header"]["batch_status"]
-    assert batch_status == "SUCCESS"
+    items = response.json()["items"]
+    assert [item["payout_item"]["sender_item_id"] for item in items] == [transaction.id]
+
+
+def test_get_receivers_skips_sellers_without_paypal_email(db, transaction, third_user):
+    db.collection("users").document(third_user["uid"]).update({"paypalEmail": firestore.DELETE_FIELD})
+    db.collection("transactions").document("transaction2").set({"sellerId": "missing_user"})
+    transactions = [transaction.get(), db.collection("transactions").document("transaction2").get()]
+    assert not paypal.get_receivers(transactions)
+    db.collection("users").document(third_user["uid"]).update({"paypalEmail": third_user["paypalEmail"]})
+    assert paypal.get_receivers(transactions) == {transaction.id: third_user["paypalEmail"]}
 
 
-def test_get_seller_data(transaction):
-    seller_paypal_email, seller_price = paypal.get_seller_data(transaction.id)
-    assert seller_paypal_email == "FF_REDACTED@googlemail.com"
-    assert seller_price == 2
+def test_get_sender_batch_id():
+    assert paypal.get_sender_batch_id(["a", "b"]) == paypal.get_sender_batch_id(["b", "a"])
+    assert paypal.get_sender_batch_id(["a", "b"]) != paypal.get_sender_batch_id(["a", "c"])
+
+
+def test_handle_payout_item_webhook(transaction):
+    event = {
+        "event_type": "PAYMENT.PAYOUTS-ITEM.SUCCEEDED",
+        "resource": {"payout_item": {"sender_item_id": transaction.id}},
+    }
+    paypal.handle_webhook(event)
+    assert transaction.get().get("payout_status") == "payout_succeeded"
 
 
 def test_refresh_access_token():
     token, expires_in = paypal.refresh_access_token()
     assert len(token) == 97
     assert expires_in / 3600 >= 8
+
+
+def test_get_access_token_is_cached_in_memory(mocker):
+    paypal.token_cache.update(token=None, expiration=0.0)
+    get_stored_access_token = mocker.spy(paypal, "get_stored_access_token")
+    token = paypal.get_access_token()
+    assert paypal.get_access_token() == token
+    assert get_stored_access_token.call_count == 1
@@ -0,0 +1,58 @@
+import time
+from unittest import mock
+
+import pytest
+import requests
+import stripe
+from taqo import aio, breaker, providers
+
+pytestmark = pytest.mark.usefixtures("closed_breakers")
+
+
+def test_call_retries_transient_errors(mocker):
+    sleep = mocker.patch("taqo.providers.time.sleep")
+    func = mocker.Mock(side_effect=[requests.ConnectionError(), stripe.RateLimitError(http_status=429), "refund1"])
+    assert providers.call("stripe.refund", func) == "refund1"
+    assert func.call_count == 3
+    assert sleep.call_count == 2
+    assert all(0 <= call.args[0] <= providers.MAX_DELAY for call in sleep.call_args_list)
+
+
+def test_call_raises_permanent_errors(mocker):
+    sleep = mocker.patch("taqo.providers.time.sleep")
+    func = mocker.Mock(side_effect=stripe.InvalidRequestError("No such payment_intent", param="payment_intent"))
+    with pytest.raises(stripe.InvalidRequestError):
+        providers.call("stripe.refund", func)
+    func.assert_called_once()
+    assert not sleep.called
+
+
+def test_call_gives_up_after_max_attempts(mocker):
+    mocker.patch("taqo.providers.time.sleep")
+    func = mocker.Mock(side_effect=providers.TransientError())
+    with pytest.raises(providers.TransientError):
+        providers.call("paypal.refund", func)
+    assert func.call_count == providers.MAX_ATTEMPTS
+
+
+def test_check_response():
+    assert providers.check_response(mock.Mock(status_code=201)).status_code == 201
+    with pytest.raises(providers.TransientError):
+        providers.check_response(mock.Mock(status_code=503))
+
+
+def test_call_async_retries_transient_errors(mocker):
+    mocker.patch("taqo.providers.asyncio.sleep", mock.AsyncMock())
+    func = mock.AsyncMock(side_effect=[providers.TransientError(), "capture1"])
+    assert aio.run(providers.call_async("paypal.capture", func)) == "capture1"
+    assert func.call_count == 2
+
+
+def test_call_fails_fast_when_circuit_is_open(mocker):
+    sleep = mocker.patch("taqo.providers.time.sleep")
+    breaker.get("paypal").state, breaker.get("paypal").until = "open", time.time() + 60
+    func = mocker.Mock()
+    with pytest.raises(breaker.CircuitOpenError):
+        providers.call("paypal.refund", func)
+    assert not func.called
+    assert not sleep.called
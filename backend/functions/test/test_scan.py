@@ -0,0 +1,35 @@
+from taqo import scan, utils
+
+
+def test_run_resumes_from_checkpoint(mocker, db, clear_db):  # pylint: disable=unused-argument
+    for i in range(5):
+        db.collection("transactions").document(f"transaction{i}").set({"status": "to_refund", "bookedAt": i})
+    query = db.collection("transactions").where("status", "==", "to_refund")
+    process_page = mocker.Mock(return_value=None)
+
+    scan.Scan("test_scan", query, "bookedAt", batch_size=2, time_budget=0).run(process_page)
+    assert [[doc.id for doc in call.args[0]] for call in process_page.call_args_list] == [
+        ["transaction0", "transaction1"]
+    ]
+    assert utils.get_checkpoint("test_scan") == [1, "transaction1"]
+
+    process_page.reset_mock()
+    scan.Scan("test_scan", query, "bookedAt", batch_size=2).run(process_page)
+    assert [[doc.id for doc in call.args[0]] for call in process_page.call_args_list] == [
+        ["transaction2", "transaction3"],
+        ["transaction4"],
+    ]
+    assert utils.get_checkpoint("test_scan") is None
+
+
+def test_run_stops_before_left_document(db, clear_db):  # pylint: disable=unused-argument
+    for i in range(5):
+        db.collection("transactions").document(f"transaction{i}").set({"status": "to_refund", "bookedAt": i})
+    query = db.collection("transactions").where("status", "==", "to_refund")
+
+    scan.Scan("test_scan", query, "bookedAt", batch_size=5).run(lambda page, deadline: page[2])
+    assert utils.get_checkpoint("test_scan") == [1, "transaction1"]
+
+    pages = []
+    scan.Scan("test_scan", query, "bookedAt", batch_size=5).run(lambda page, deadline: pages.append(page))
+    assert [[doc.id for doc in page] for page in pages] == [["transaction2", "transaction3", "transaction4"]]
@@ -5,9 +5,10 @@ import pytest
 from taqo import stripe_utils
 
 
-def test_get_stripe_customer_id(sample_data, third_user):  # pylint: disable=unused-argument
-    customer_id = stripe_utils.get_stripe_customer_id(third_user["uid"])
-    assert customer_id == third_user["stripeCustomerId"]
+def test_handle_webhook_refunded(transaction):
+    event = {"type": "charge.refunded", "data": {"object": {"metadata": {"transactionId": transaction.id}}}}
+    stripe_utils.handle_webhook(event)
+    assert transaction.get().get("status") == "payment_refunded"
 
 
 @pytest.mark.skip(reason="additional setup required")
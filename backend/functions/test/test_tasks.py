@@ -0,0 +1,44 @@
+import time
+
+import pytest
+from firebase_admin import exceptions
+from taqo import config, tasks
+
+
+def test_timer_wheel_dispatches_when_due(mocker):
+    handler = mocker.Mock()
+    wheel = tasks.TimerWheel({"expire_reservation": handler}, start=False)
+    now = time.time()
+    wheel.enqueue("expire_reservation", {"spotId": "spot1"}, run_at=int(now) + 3, task_id="spot1-1")
+    wheel.enqueue("expire_reservation", {"spotId": "spot1"}, run_at=int(now) + 3, task_id="spot1-1")
+    wheel.enqueue("expire_reservation", {"spotId": "spot2"}, run_at=int(now) + tasks.WHEEL_SLOTS + 2, task_id="spot2-1")
+    for _ in range(4):
+        wheel.advance()
+    handler.assert_called_once_with({"spotId": "spot1"})
+    for _ in range(tasks.WHEEL_SLOTS):
+        wheel.advance()
+    assert handler.call_count == 2
+    assert not wheel.task_ids
+
+
+def test_timer_wheel_logs_handler_errors(mocker):
+    log = mocker.patch("taqo.tasks.logger.error")
+    wheel = tasks.TimerWheel({"expire_reservation": mocker.Mock(side_effect=ValueError)}, start=False)
+    wheel.enqueue("expire_reservation", {}, run_at=0, task_id="spot1-1")
+    wheel.advance()
+    log.assert_called_once()
+
+
+def test_cloud_tasks_queue_skips_scheduled_tasks(mocker):
+    task_queue = mocker.patch("firebase_admin.functions.task_queue")
+    queue = task_queue.return_value
+    queue.enqueue.side_effect = [None, exceptions.AlreadyExistsError("exists", cause=None, http_response=None)]
+    for _ in range(2):
+        tasks.CloudTasksQueue().enqueue("expire_reservation", {"spotId": "spot1"}, run_at=1, task_id="spot1-1")
+    task_queue.assert_called_with(f"locations/{config.REGION}/functions/expire_reservation")
+    options = queue.enqueue.call_args.args[1]
+    assert (options.task_id, options.schedule_time.timestamp()) == ("spot1-1", 1)
+
+    queue.enqueue.side_effect = exceptions.InvalidArgumentError("invalid")
+    with pytest.raises(exceptions.InvalidArgumentError):
+        tasks.CloudTasksQueue().enqueue("expire_reservation", {}, run_at=1, task_id="spot1-2")
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+from taqo import tokens
+
+
+@pytest.fixture(autouse=True)
+def clear_verified_tokens(mocker):
+    mocker.patch.dict(tokens.verified_tokens, clear=True)
+
+
+def test_verify_id_token_is_cached(mocker):
+    verify = mocker.patch("firebase_admin.auth.verify_id_token", return_value={"uid": "user1", "exp": time.time() + 60})
+    assert tokens.verify_id_token("token1")["uid"] == "user1"
+    assert tokens.verify_id_token("token1")["uid"] == "user1"
+    assert verify.call_count == 1
+    assert "token1" not in tokens.verified_tokens
+
+
+def test_expired_token_is_verified_again(mocker):
+    verify = mocker.patch("firebase_admin.auth.verify_id_token", return_value={"uid": "user1", "exp": time.time() - 1})
+    tokens.verify_id_token("token1")
+    tokens.verify_id_token("token1")
+    assert verify.call_count == 2
+
+
+def test_least_recently_used_token_is_evicted(mocker):
+    mocker.patch("taqo.tokens.MAX_CACHED_TOKENS", 2)
+    verify = mocker.patch("firebase_admin.auth.verify_id_token", return_value={"uid": "user1", "exp": time.time() + 60})
+    tokens.verify_id_token("token1")
+    tokens.verify_id_token("token2")
+    tokens.verify_id_token("token1")
+    tokens.verify_id_token("token3")
+    tokens.verify_id_token("token1")
+    assert verify.call_count == 3
+    tokens.verify_id_token("token2")
+    assert verify.call_count == 4
+
+
+def test_invalid_token_is_not_cached(mocker):
+    verify = mocker.patch("firebase_admin.auth.verify_id_token", side_effect=ValueError)
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            tokens.verify_id_token("token1")
+    assert verify.call_count == 2
@@ -2,8 +2,9 @@
 from unittest import mock
 
 import pytest
+from firebase_admin import exceptions, messaging
 from firebase_functions import https_fn
-from taqo import config, utils
+from taqo import config, core, utils
 
 
 def test_update_transaction(transaction):
@@ -12,6 +13,23 @@ def test_update_transaction(transaction):
     assert transaction.get().get("status") == "charged_buyer"
 
 
+def test_update_transactions(sample_data, android_user):
+    spot_id = sample_data
+    transaction_refs = [
+        core.create_transaction(spot_id, android_user["uid"], payment_provider="paypal")[0] for _ in range(3)
+    ]
+    utils.update_transactions([ref.id for ref in transaction_refs], {"status": "charged_buyer"})
+    assert all(ref.get().get("status") == "charged_buyer" for ref in transaction_refs)
+
+
+def test_exists_and_count(db, sample_data, third_user):  # pylint: disable=unused-argument
+    spots_ref = db.collection("spots")
+    assert utils.exists(spots_ref.where("sellerId", "==", third_user["uid"]))
+    assert not utils.exists(spots_ref.where("sellerId", "==", "user123"))
+    assert utils.count(spots_ref.where("sellerId", "==", third_user["uid"])) == 1
+    assert utils.count(spots_ref) == 7
+
+
 def test_update_spot_success(db, sample_data):
     spot_id = sample_data
     utils.update_spot(spot_id, utils.is_available, {"status": "reserved"})
@@ -122,6 +140,45 @@ def test_send_notification_multiple_users(ios_user, android_user, body):
     )
 
 
+def test_send_notification_in_chunks(mocker):
+    user_tokens = [(mock.Mock(), f"token{i}") for i in range(1001)]
+    mocker.patch("taqo.utils.get_user_tokens", return_value=user_tokens)
+    send = mocker.patch("firebase_admin.messaging.send_each_for_multicast")
+    send.side_effect = lambda message: mock.Mock(responses=[mock.Mock(success=True)] * len(message.tokens))
+    utils.send_notification(user_ids=["user123"], title="Sale", body="body", data={"type": "sold_spot"})
+    assert sorted(len(call.args[0].tokens) for call in send.call_args_list) == [1, 500, 500]
+
+
+def test_send_notification_prunes_invalid_tokens(mocker, db, sample_data, ios_user, android_user):
+    # pylint: disable=unused-argument
+    def send(token):
+        if token == ios_user["messagingToken"]:
+            return mock.Mock(success=False, exception=messaging.UnregisteredError("unregistered"))
+        return mock.Mock(success=True)
+
+    def send_each_for_multicast(message):
+        return mock.Mock(responses=[send(token) for token in message.tokens])
+
+    mocker.patch("firebase_admin.messaging.send_each_for_multicast", side_effect=send_each_for_multicast)
+    user_ids = [ios_user["uid"], android_user["uid"]]
+    utils.send_notification(user_ids, title="Sale", body="body", data={"type": "sold_spot"})
+    assert "messagingToken" not in db.collection("users").document(ios_user["uid"]).get().to_dict()
+    assert db.collection("users").document(android_user["uid"]).get().get("messagingToken")
+
+
+def test_send_notification_keeps_tokens_on_payload_errors(mocker, db, sample_data, ios_user, android_user):
+    # pylint: disable=unused-argument
+    def send_each_for_multicast(message):
+        error = exceptions.InvalidArgumentError("Message payload is too large.")
+        return mock.Mock(responses=[mock.Mock(success=False, exception=error) for _ in message.tokens])
+
+    mocker.patch("firebase_admin.messaging.send_each_for_multicast", side_effect=send_each_for_multicast)
+    user_ids = [ios_user["uid"], android_user["uid"]]
+    utils.send_notification(user_ids, title="Sale", body="body", data={"type": "sold_spot"})
+    assert db.collection("users").document(ios_user["uid"]).get().get("messagingToken")
+    assert db.collection("users").document(android_user["uid"]).get().get("messagingToken")
+
+
 def test_get_message_tokens(ios_user, android_user, third_user):
     assert utils.get_messaging_tokens("user123") == []  # pylint: disable=C1803
     assert utils.get_messaging_tokens(third_user["uid"]) == []  # pylint: disable=C1803
@@ -132,6 +189,38 @@ def test_get_message_tokens(ios_user, android_user, third_user):
     ]
 
 
+def test_flush_messages(mocker):
+    publisher = mocker.patch("taqo.utils.get_publisher").return_value
+    mocker.patch("taqo.utils.get_topic_path", return_value="topic")
+    with utils.message_scope():
+        utils.publish_message("send-email", {"to": "user123"}, block=False)
+        with utils.message_scope():
+            utils.publish_message("send-email", {"to": "user456"}, block=False)
+        assert publisher.publish.return_value.result.call_count == 1
+    assert publisher.publish.return_value.result.call_count == 2
+    assert utils.pending_futures.get() is None
+
+
+def test_get_documents(sample_data, ios_user, android_user):  # pylint: disable=unused-argument
+    users = utils.get_documents("users", [ios_user["uid"], android_user["uid"], "user123"], field_paths=["paypalEmail"])
+    assert users[ios_user["uid"]].to_dict() == {"paypalEmail": ios_user["paypalEmail"]}
+    assert users[android_user["uid"]].get("paypalEmail") == android_user["paypalEmail"]
+    assert not users["user123"].exists
+
+
+def test_render_email():
+    body, html = utils.render_email("spot_sold", {})
+    assert body == utils.get_email("spot_sold")
+    assert html.startswith("<p>Hi,")
+
+
+def test_render_email_substitutes_variables(mocker):
+    mocker.patch("taqo.utils.get_email_templates", return_value={"test": ("Hi $name", "<p>Hi $name</p>")})
+    body, html = utils.render_email("test", {"name": "<Alex>"})
+    assert body == "Hi <Alex>"
+    assert html == "<p>Hi &lt;Alex&gt;</p>"
+
+
 def test_send_email():
     utils.send_email(config.OPS_EMAIL, "Test", utils.get_email("account_deleted"))
 
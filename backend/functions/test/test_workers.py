@@ -0,0 +1,46 @@
+import threading
+import time
+
+from taqo import workers
+
+
+def test_rate_limiter():
+    rate_limiter = workers.RateLimiter(requests_per_second=20)
+    start = time.monotonic()
+    for _ in range(5):
+        rate_limiter.acquire()
+    assert time.monotonic() - start >= 0.2
+
+
+def test_run_by_provider():
+    lock = threading.Lock()
+    running = {"a": 0, "b": 0}
+    max_running = {"a": 0, "b": 0}
+
+    def func(item):
+        provider, value = item
+        with lock:
+            running[provider] += 1
+            max_running[provider] = max(max_running[provider], running[provider])
+        time.sleep(0.01)
+        with lock:
+            running[provider] -= 1
+        if value < 0:
+            raise ValueError(value)
+
+    items = [("a", 1), ("b", -1), ("a", 2), ("a", -2), ("b", 3), ("a", 4)]
+    limits = {
+        "a": workers.ProviderLimit(max_workers=2, requests_per_second=1000),
+        "b": workers.ProviderLimit(max_workers=1, requests_per_second=1000),
+    }
+    errors = workers.run_by_provider(func, items, lambda item: item[0], limits)
+    assert [error is None for error in errors] == [True, False, True, False, True, True]
+    assert max_running == {"a": 2, "b": 1}
+
+
+def test_run_by_provider_stops_at_deadline():
+    items = [("a", 1), ("a", 2), ("a", 3)]
+    limits = {"a": workers.ProviderLimit(max_workers=1, requests_per_second=10)}
+    deadline = time.monotonic() + 0.15
+    errors = workers.run_by_provider(lambda item: None, items, lambda item: item[0], limits, deadline)
+    assert [type(error) for error in errors] == [type(None), type(None), workers.DeadlineExceeded]
@@ -1,6 +1,6 @@
 #!/usr/bin/env bash
 
-TARGETS="functions/taqo/ functions/main.py functions/test"
+TARGETS="functions/taqo/ functions/main.py functions/test functions/benchmark"
 
 set -eux
 